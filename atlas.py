@@ -0,0 +1,185 @@
+import argparse
+import json
+import math
+import os
+
+import numpy as np
+from PIL import Image
+
+from bmp import UnsupportedBmp, read_bmp
+
+PADDING = 2
+MAX_SIZE = 8192
+
+
+class SkylinePacker:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.skyline = [[0, 0, width]]
+
+    def _fit(self, index, w, h):
+        x = self.skyline[index][0]
+        if x + w > self.width:
+            return None
+        y = 0
+        remaining = w
+        i = index
+        while remaining > 0:
+            if i >= len(self.skyline):
+                return None
+            y = max(y, self.skyline[i][1])
+            if y + h > self.height:
+                return None
+            remaining -= self.skyline[i][2]
+            i += 1
+        return y
+
+    def insert(self, w, h):
+        best = None
+        for index in range(len(self.skyline)):
+            y = self._fit(index, w, h)
+            if y is None:
+                continue
+            score = (y + h, self.skyline[index][0])
+            if best is None or score < best[0]:
+                best = (score, index, y)
+        if best is None:
+            return None
+        _, index, y = best
+        x = self.skyline[index][0]
+        self._add_segment(index, x, y + h, w)
+        return x, y
+
+    def _add_segment(self, index, x, y, w):
+        self.skyline.insert(index, [x, y, w])
+        i = index + 1
+        while i < len(self.skyline):
+            seg = self.skyline[i]
+            end = x + w
+            if seg[0] >= end:
+                break
+            shrink = end - seg[0]
+            if seg[2] <= shrink:
+                del self.skyline[i]
+                continue
+            seg[0] += shrink
+            seg[2] -= shrink
+            break
+        i = 0
+        while i < len(self.skyline) - 1:
+            if self.skyline[i][1] == self.skyline[i + 1][1]:
+                self.skyline[i][2] += self.skyline[i + 1][2]
+                del self.skyline[i + 1]
+            else:
+                i += 1
+
+    def used_height(self):
+        return max(seg[1] for seg in self.skyline)
+
+
+def max_mip_level(padding):
+    # Level n halves the extruded border n times; once it is gone, tiles at
+    # unaligned offsets share texels with their neighbours.
+    return int(math.log2(padding)) if padding >= 1 else 0
+
+
+class Atlas:
+    def __init__(self, image, rects, padding=PADDING):
+        self.image = image
+        self.rects = rects
+        self.padding = padding
+        self.max_level = max_mip_level(padding)
+        height, width = image.shape[:2]
+        self.uvs = {
+            name: (x / width, y / height, (x + w) / width, (y + h) / height)
+            for name, (x, y, w, h) in rects.items()
+        }
+
+    def remap(self, name, s, t):
+        u0, v0, u1, v1 = self.uvs[name]
+        return u0 + s * (u1 - u0), v0 + t * (v1 - v0)
+
+    def to_dict(self):
+        height, width = self.image.shape[:2]
+        return {'width': width, 'height': height, 'padding': self.padding,
+                'max_level': self.max_level, 'rects': self.rects, 'uvs': self.uvs}
+
+
+def _next_power_of_two(value):
+    return 1 << max(0, math.ceil(math.log2(max(1, value))))
+
+
+def pack(sizes, padding=PADDING, max_size=MAX_SIZE):
+    order = sorted(sizes, key=lambda name: (-sizes[name][1], -sizes[name][0], name))
+    area = sum((w + 2 * padding) * (h + 2 * padding) for w, h in sizes.values())
+    widest = max(w for w, _ in sizes.values()) + 2 * padding
+    width = max(_next_power_of_two(widest), _next_power_of_two(math.sqrt(area)))
+
+    while width <= max_size:
+        packer = SkylinePacker(width, max_size)
+        positions = {}
+        for name in order:
+            w, h = sizes[name]
+            spot = packer.insert(w + 2 * padding, h + 2 * padding)
+            if spot is None:
+                break
+            positions[name] = (spot[0] + padding, spot[1] + padding, w, h)
+        else:
+            return positions, width, packer.used_height()
+        width *= 2
+    raise ValueError('Textures do not fit into a %dx%d atlas' % (max_size, max_size))
+
+
+def build_atlas(images, padding=PADDING, max_size=MAX_SIZE):
+    sizes = {name: (image.shape[1], image.shape[0]) for name, image in images.items()}
+    rects, width, height = pack(sizes, padding, max_size)
+
+    atlas = np.zeros((height, width, 3), dtype=np.uint8)
+    for name, (x, y, w, h) in rects.items():
+        # Edge pixels are extruded into the padding so that linear filtering
+        # does not bleed neighbouring tiles into each other. The padding only
+        # lasts down to Atlas.max_level; smaller mip levels must not be used.
+        padded = np.pad(images[name], ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+        atlas[y - padding:y + h + padding, x - padding:x + w + padding] = padded
+    return Atlas(atlas, rects, padding)
+
+
+def load_image(path):
+    try:
+        return read_bmp(path)
+    except (OSError, UnsupportedBmp):
+        return np.flipud(np.array(Image.open(path).convert('RGB')))
+
+
+def load_media(directory='media', exclude=('atlas',)):
+    images = {}
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext.lower() in ('.bmp', '.png') and name not in exclude:
+            images[name] = load_image(os.path.join(directory, filename))
+    return images
+
+
+def save_atlas(atlas, image_path, json_path):
+    Image.fromarray(np.flipud(atlas.image)).save(image_path)
+    with open(json_path, 'w') as f:
+        json.dump(atlas.to_dict(), f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pack media textures into one atlas.')
+    parser.add_argument('--media', default='media')
+    parser.add_argument('--image', default='atlas.bmp')
+    parser.add_argument('--json', default='atlas.json')
+    parser.add_argument('--padding', type=int, default=PADDING)
+    args = parser.parse_args(argv)
+
+    atlas = build_atlas(load_media(args.media), args.padding)
+    save_atlas(atlas, args.image, args.json)
+    height, width = atlas.image.shape[:2]
+    print('Packed %d textures into %dx%d' % (len(atlas.rects), width, height))
+
+
+if __name__ == '__main__':
+    main()
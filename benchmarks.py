@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+TEXTURE_SIZES = (256, 512, 1024, 2048)
+MESH_SEGMENTS = (16, 256, 4096, 65536)
+FRAME_SIZE = (640, 480)
+FRAME_COUNT = 30
+STRESS_COUNTS = (1, 100, 1000, 10000, 100000)
+THRESHOLD = 0.10
+
+
+def measure(func, repeat=5, warmup=1):
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return summarize(times)
+
+
+def summarize(times_ms):
+    times = np.asarray(times_ms, dtype=np.float64)
+    return {
+        'median_ms': float(np.median(times)),
+        'min_ms': float(times.min()),
+        'mean_ms': float(times.mean()),
+        'p95_ms': float(np.percentile(times, 95)),
+        'runs': int(times.size),
+    }
+
+
+def bench_textures(sizes, repeat):
+    import textures
+
+    results = {}
+    for size in sizes:
+        results['texture/wood_array/%d' % size] = measure(lambda: textures.wood_array(size), repeat)
+        results['texture/spiral_array/%d' % size] = measure(lambda: textures.spiral_array(size), repeat)
+        results['texture/checkerboard_array/%d' % size] = measure(
+            lambda: textures.checkerboard_array(size), repeat)
+
+    # create_* write into media/ relative to the working directory, so they run
+    # in a scratch copy and always miss the disk cache.
+    from texture_cache import TextureCache
+    workdir = tempfile.mkdtemp(prefix='texture-bench-')
+    cwd = os.getcwd()
+    try:
+        os.makedirs(os.path.join(workdir, 'media'))
+        os.chdir(workdir)
+        cache = TextureCache(os.path.join(workdir, 'cache'))
+        for size in sizes:
+            # The wood tiles are the halves of the 2x2 checkerboard below.
+            results['texture/create_wood_textures/%d' % (size // 2)] = measure(
+                lambda: (cache.clear(), textures.create_wood_textures(size // 2, cache=cache)), repeat)
+            results['texture/create_2x2_checkerboard/%d' % size] = measure(
+                lambda: textures.create_2x2_checkerboard(size), repeat)
+            results['texture/create_spiral_pattern/%d' % size] = measure(
+                lambda: (cache.clear(), textures.create_spiral_pattern(size, cache=cache)), repeat)
+        results['texture/create_test_texture/512'] = measure(textures.create_test_texture, repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def bench_lab4_textures(sizes, repeat):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    import lab4
+
+    results = {}
+    widget = lab4.GLWidget()
+    widget.texture_cache = None
+    for size in sizes:
+        widget.set_texture_size(size, size)
+        results['lab4/calculate_checkerboard_texture/%d' % size] = measure(
+            widget.calculate_checkerboard_texture, repeat)
+        results['lab4/calculate_pattern_texture/%d' % size] = measure(
+            widget.calculate_pattern_texture, repeat)
+    widget.set_texture_size(512, 512)
+    results['lab4/load_bmp_texture/512'] = measure(
+        lambda widget=widget: widget.load_bmp_texture('media/texture.bmp'), repeat)
+    del widget, app
+    return results
+
+
+def bench_meshes(segments, repeat):
+    import meshes
+
+    results = {}
+    for n in segments:
+        for name in ('prism', 'pyramid', 'cylinder', 'tube'):
+            builder = getattr(meshes, name).__wrapped__
+            results['mesh/%s/%d' % (name, n)] = measure(lambda: builder(n), repeat)
+    return results
+
+
+def bench_frames(scenes, frames, width, height):
+    import headless
+
+    groups = {}
+    for scene in scenes:
+        groups.setdefault(headless.binding(scene), []).append(scene)
+
+    results = {}
+    for group in groups.values():
+        command = [sys.executable, os.path.abspath(__file__), 'frames',
+                   '--frames', str(frames), '--size', '%dx%d' % (width, height), *group]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.update(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def frames_command(args):
+    import headless
+
+    width, height = (int(v) for v in args.size.split('x'))
+    results = {}
+    for scene in args.scenes:
+        _, timings = headless.render_scene(scene, args.frames + 1, width, height)
+        results['frame/%s/%dx%d' % (scene, width, height)] = summarize(timings['render_ms'][1:])
+    print(json.dumps(results))
+
+
+def stress_command(args):
+    scenes = ['lab2:%s:%s:%d:%s' % (args.shape, args.mode, n, args.layout) for n in args.counts]
+    results = bench_frames(scenes, args.frames, *FRAME_SIZE)
+    print('%10s %12s %12s %16s' % ('instances', 'median ms', 'p95 ms', 'instances/s'))
+    for n, scene in zip(args.counts, scenes):
+        stats = results['frame/%s/%dx%d' % ((scene,) + FRAME_SIZE)]
+        print('%10d %12.3f %12.3f %16.0f' % (
+            n, stats['median_ms'], stats['p95_ms'], n / (stats['median_ms'] / 1000.0)))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+def run_command(args):
+    sizes = TEXTURE_SIZES[:2] if args.quick else TEXTURE_SIZES
+    segments = MESH_SEGMENTS[:2] if args.quick else MESH_SEGMENTS
+    results = {}
+    results.update(bench_textures(sizes, args.repeat))
+    results.update(bench_lab4_textures(sizes, args.repeat))
+    results.update(bench_meshes(segments, args.repeat))
+    if not args.skip_frames:
+        import headless
+        results.update(bench_frames(headless.all_scenes(), args.frames, *FRAME_SIZE))
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    for name, stats in sorted(results.items()):
+        print('%-50s %10.3f ms' % (name, stats['median_ms']))
+    print('Saved %d benchmarks to %s' % (len(results), args.output))
+
+
+def compare(baseline, current, threshold=THRESHOLD, metric='median_ms'):
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        old = baseline.get(name, {}).get(metric)
+        new = current.get(name, {}).get(metric)
+        if old is None or new is None:
+            rows.append((name, old, new, None, 'missing'))
+            continue
+        ratio = new / old if old > 0 else float('inf')
+        if ratio > 1 + threshold:
+            status = 'REGRESSION'
+        elif ratio < 1 - threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, old, new, ratio, status))
+    return rows
+
+
+def compare_command(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)['results']
+    with open(args.current) as f:
+        current = json.load(f)['results']
+
+    rows = compare(baseline, current, args.threshold, args.metric)
+    regressions = 0
+    for name, old, new, ratio, status in rows:
+        if status == 'missing':
+            print('%-50s %10s %10s %8s  missing' % (name, old and '%.3f' % old, new and '%.3f' % new, ''))
+            continue
+        print('%-50s %10.3f %10.3f %7.2fx  %s' % (name, old, new, ratio, status))
+        regressions += status == 'REGRESSION'
+    print('%d regression(s) above %.0f%%' % (regressions, args.threshold * 100))
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark texture generation, meshes and frame rendering.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='run the benchmark suite and save JSON results')
+    run.add_argument('-o', '--output', default='benchmarks.json')
+    run.add_argument('--repeat', type=int, default=5)
+    run.add_argument('--frames', type=int, default=FRAME_COUNT)
+    run.add_argument('--quick', action='store_true', help='only the two smallest sizes')
+    run.add_argument('--skip-frames', action='store_true', help='skip headless frame rendering')
+
+    cmp = commands.add_parser('compare', help='flag regressions against a saved baseline')
+    cmp.add_argument('baseline')
+    cmp.add_argument('current')
+    cmp.add_argument('--threshold', type=float, default=THRESHOLD)
+    cmp.add_argument('--metric', default='median_ms')
+
+    stress = commands.add_parser('stress', help='lab2 instanced frame time as the instance count grows')
+    stress.add_argument('--counts', type=int, nargs='+', default=list(STRESS_COUNTS))
+    stress.add_argument('--shape', default='cube', choices=('cube', 'prism', 'pyramid'))
+    stress.add_argument('--mode', default='fill', choices=('fill', 'line', 'point'))
+    stress.add_argument('--layout', default='grid', choices=('grid', 'random'))
+    stress.add_argument('--frames', type=int, default=FRAME_COUNT)
+    stress.add_argument('-o', '--output', help='also save the results as JSON')
+
+    frames = commands.add_parser('frames', help=argparse.SUPPRESS)
+    frames.add_argument('scenes', nargs='+')
+    frames.add_argument('--frames', type=int, default=FRAME_COUNT)
+    frames.add_argument('--size', default='%dx%d' % FRAME_SIZE)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        return run_command(args)
+    if args.command == 'compare':
+        return compare_command(args)
+    if args.command == 'stress':
+        return stress_command(args)
+    return frames_command(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
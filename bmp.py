@@ -0,0 +1,64 @@
+import os
+import struct
+
+import numpy as np
+
+BI_RGB = 0
+BI_BITFIELDS = 3
+HEADER_SIZE = 54
+
+
+class UnsupportedBmp(ValueError):
+    pass
+
+
+def row_stride(width, bits_per_pixel):
+    return ((width * bits_per_pixel + 31) // 32) * 4
+
+
+def read_header(data):
+    if bytes(data[:2]) != b'BM':
+        raise UnsupportedBmp('not a BMP file')
+    if len(data) < HEADER_SIZE:
+        raise UnsupportedBmp('truncated header')
+    pixel_offset, = struct.unpack_from('<I', data, 10)
+    header_size, width, height, planes, bits, compression = struct.unpack_from('<IiiHHI', data, 14)
+    if header_size < 40:
+        raise UnsupportedBmp('OS/2 BMP headers are not supported')
+    if width <= 0 or height == 0:
+        raise UnsupportedBmp('empty image')
+    return pixel_offset, width, height, bits, compression
+
+
+def read_bmp(path):
+    # Returns an RGB view straight into a memory map of the file. Rows are in
+    # bottom-up order, the same order glTexImage2D expects, and the BGR->RGB
+    # swap is a negative channel stride, so nothing is copied until upload.
+    # np.memmap refuses empty files, so short files are rejected up front.
+    if os.path.getsize(path) < HEADER_SIZE:
+        raise UnsupportedBmp('truncated header')
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    pixel_offset, width, height, bits, compression = read_header(data)
+    if bits not in (24, 32) or compression not in (BI_RGB, BI_BITFIELDS):
+        raise UnsupportedBmp('only uncompressed 24/32-bit BMPs are memory-mapped')
+    if compression == BI_BITFIELDS:
+        if data.size < HEADER_SIZE + 12:
+            raise UnsupportedBmp('truncated channel masks')
+        masks = struct.unpack_from('<III', data, 54)
+        if masks != (0x00FF0000, 0x0000FF00, 0x000000FF):
+            raise UnsupportedBmp('unusual BI_BITFIELDS channel masks')
+
+    rows = abs(height)
+    stride = row_stride(width, bits)
+    if pixel_offset + stride * rows > data.size:
+        raise UnsupportedBmp('truncated pixel data')
+
+    bytes_per_pixel = bits // 8
+    bgr = np.lib.stride_tricks.as_strided(
+        data[pixel_offset:],
+        shape=(rows, width, 3),
+        strides=(stride, bytes_per_pixel, 1),
+        writeable=False)
+    if height < 0:
+        bgr = bgr[::-1]
+    return bgr[..., ::-1]
@@ -0,0 +1,215 @@
+import atexit
+import ctypes
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.error import GLError, NullFunctionError
+
+from streaming import BAND_ROWS, write_png, write_raw
+
+CAPTURE_RING = 3
+CAPTURE_FORMATS = ('png', 'raw')
+PNG_LEVEL = 1
+STAGING_NAME = '.staging-%d.npy'
+
+_staging = {}
+
+
+def frame_rows(frame, band_rows=BAND_ROWS):
+    # GL rows come bottom-up; the writers take top-down bands.
+    image = frame[::-1]
+    for y0 in range(0, len(image), band_rows):
+        yield y0, image[y0:y0 + band_rows]
+
+
+def encode_frame(staging_path, slot, path, level=PNG_LEVEL):
+    # Runs in a worker process. The staging file is mapped once per worker
+    # and the frame is read from it in place.
+    staging = _staging.get(staging_path)
+    if staging is None:
+        # Each frame size gets its own staging file, so a new path means the
+        # capture was restarted and the older mappings are stale.
+        _staging.clear()
+        staging = _staging[staging_path] = np.load(staging_path, mmap_mode='r')
+    frame = staging[slot]
+    height, width = frame.shape[:2]
+    if path.endswith('.png'):
+        write_png(path, width, height, frame_rows(frame), level)
+    else:
+        write_raw(path, width, height, frame_rows(frame))
+    return path
+
+
+class FrameCapture:
+    # Reads frames back through a ring of pixel pack buffers: glReadPixels
+    # into a PBO returns at once, and each buffer is only mapped once the
+    # ring comes round to it again, CAPTURE_RING - 1 frames later, when the
+    # copy has long finished. The mapped pixels are copied into a slot of a
+    # memory-mapped staging file that worker processes read and encode, so
+    # a frame crosses to the encoders without being pickled. The renderer
+    # only waits when every staging slot is still queued for encoding;
+    # those waits are counted in stats['stalls'].
+    def __init__(self, directory, fmt='png', ring=CAPTURE_RING, workers=None, slots=None,
+                 level=PNG_LEVEL, prefix='frame'):
+        if fmt not in CAPTURE_FORMATS:
+            raise ValueError('Unknown capture format: %s' % fmt)
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fmt = fmt
+        self.ring = ring
+        self.workers = workers or os.cpu_count() or 1
+        self.slots = slots or self.workers * 2 + 1
+        self.level = level
+        self.prefix = prefix
+        self.size = None
+        self.pbos = None
+        self.staging = None
+        self.staging_path = None
+        self.generation = 0
+        self.pool = None
+        self.in_flight = deque()
+        self.pending = deque()
+        self.free = deque()
+        self.frame = 0
+        self.closed = False
+        self.paths = []
+        self.stats = {'frames': 0, 'encoded': 0, 'stalls': 0, 'stall_ms': 0.0, 'synchronous': False}
+
+    @property
+    def started(self):
+        return self.size is not None
+
+    def capture(self):
+        width, height = (int(v) for v in glGetIntegerv(GL_VIEWPORT)[2:])
+        if self.size != (width, height):
+            self.start(width, height)
+        if len(self.in_flight) == self.ring:
+            self.retire()
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        if self.pbos is None:
+            pixels = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+            slot = self.acquire()
+            self.staging[slot] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width, 3)
+            self.submit(slot, self.frame)
+        else:
+            pbo = self.pbos[self.frame % self.ring]
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+            glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+            self.in_flight.append((pbo, self.frame))
+        self.frame += 1
+        self.stats['frames'] += 1
+        self.collect()
+
+    def start(self, width, height):
+        # A new framebuffer size starts a new staging file and PBO ring; the
+        # frames still in flight are finished at the old size first.
+        if self.started:
+            self.flush()
+            self.release()
+        self.size = (width, height)
+        self.generation += 1
+        self.staging_path = os.path.join(self.directory, STAGING_NAME % self.generation)
+        self.staging = np.lib.format.open_memmap(
+            self.staging_path, mode='w+', dtype=np.uint8, shape=(self.slots, height, width, 3))
+        self.free = deque(range(self.slots))
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            self.pbos = [int(pbo) for pbo in np.atleast_1d(glGenBuffers(self.ring))]
+            for pbo in self.pbos:
+                glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+                glBufferData(GL_PIXEL_PACK_BUFFER, width * height * 3, None, GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        except (GLError, NullFunctionError) as e:
+            print('Pixel buffer objects unavailable, capturing synchronously: %s' % e)
+            self.pbos = None
+            self.stats['synchronous'] = True
+
+    def retire(self):
+        pbo, number = self.in_flight.popleft()
+        width, height = self.size
+        slot = self.acquire()
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, pbo)
+        pointer = glMapBufferRange(GL_PIXEL_PACK_BUFFER, 0, width * height * 3, GL_MAP_READ_BIT)
+        ctypes.memmove(self.staging[slot].ctypes.data, pointer, width * height * 3)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.submit(slot, number)
+
+    def acquire(self):
+        self.collect()
+        while not self.free:
+            start = time.perf_counter()
+            self.finish_oldest()
+            self.stats['stalls'] += 1
+            self.stats['stall_ms'] += (time.perf_counter() - start) * 1000.0
+        return self.free.popleft()
+
+    def submit(self, slot, number):
+        path = os.path.join(self.directory, '%s%06d.%s' % (self.prefix, number, self.fmt))
+        future = self.pool.submit(encode_frame, self.staging_path, slot, path, self.level)
+        self.pending.append((future, slot))
+
+    def collect(self):
+        while self.pending and self.pending[0][0].done():
+            self.finish_oldest()
+
+    def finish_oldest(self):
+        future, slot = self.pending.popleft()
+        self.paths.append(future.result())
+        self.stats['encoded'] += 1
+        self.free.append(slot)
+
+    def flush(self):
+        # Needs the capturing context to be current.
+        while self.in_flight:
+            self.retire()
+        while self.pending:
+            self.finish_oldest()
+
+    def release(self):
+        if self.pbos is not None:
+            glDeleteBuffers(len(self.pbos), self.pbos)
+            self.pbos = None
+        self.drop_staging()
+
+    def drop_staging(self):
+        self.staging = None
+        if self.staging_path is not None and os.path.exists(self.staging_path):
+            os.remove(self.staging_path)
+
+    def close(self, context=True):
+        # Without a current context the frames still sitting in PBOs are lost;
+        # everything already staged is encoded either way.
+        if self.closed:
+            return
+        self.closed = True
+        if context and self.started:
+            self.flush()
+            self.release()
+        else:
+            self.in_flight.clear()
+            self.pbos = None
+            while self.pending:
+                self.finish_oldest()
+            self.drop_staging()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def summary(self):
+        return dict(self.stats, directory=self.directory, format=self.fmt, size=self.size)
+
+
+def enable_from_environment(widget):
+    directory = os.environ.get('FRAME_CAPTURE')
+    if not directory:
+        return
+    capture = FrameCapture(directory, os.environ.get('FRAME_CAPTURE_FORMAT', 'png'))
+    widget.frame_capture = capture
+    atexit.register(lambda: capture.close(context=False))
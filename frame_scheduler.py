@@ -0,0 +1,64 @@
+import time
+
+
+class ManualClock:
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def tick(self, seconds):
+        self.now += seconds
+
+
+class FrameScheduler:
+    # Repaints are chained off QOpenGLWidget.frameSwapped, so they run at the
+    # swap (vsync) rate and stop by themselves while the widget is hidden or
+    # not exposed: no paint means no swap, and Qt repaints on the next expose.
+    def __init__(self, widget, callback, degrees_per_second=50.0, clock=time.monotonic):
+        self.widget = widget
+        self.callback = callback
+        self.degrees_per_second = degrees_per_second
+        self.clock = clock
+        self.origin = clock()
+        self.paused_at = None
+        self.running = False
+        widget.frameSwapped.connect(self.frame_swapped)
+
+    def angle(self):
+        now = self.paused_at if self.paused_at is not None else self.clock()
+        return ((now - self.origin) * self.degrees_per_second) % 360.0
+
+    def start(self):
+        if self.paused_at is not None:
+            self.origin += self.clock() - self.paused_at
+            self.paused_at = None
+        self.running = True
+        self.widget.update()
+
+    def stop(self):
+        if self.paused_at is None:
+            self.paused_at = self.clock()
+        self.running = False
+
+    def reset(self, angle=0.0):
+        self.origin = self.clock() - angle / self.degrees_per_second
+        if self.paused_at is not None:
+            self.paused_at = self.clock()
+
+    def set_clock(self, clock):
+        angle = self.angle()
+        self.clock = clock
+        self.reset(angle)
+
+    def visible(self):
+        widget = self.widget
+        if not widget.isVisible() or widget.visibleRegion().isEmpty():
+            return False
+        handle = widget.window().windowHandle()
+        return handle is None or handle.isExposed()
+
+    def frame_swapped(self):
+        if self.running and self.visible():
+            self.callback()
@@ -0,0 +1,294 @@
+import atexit
+import ctypes
+import functools
+import importlib
+import json
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+from OpenGL import GL
+from OpenGL.GL import *
+from OpenGL.error import GLError, NullFunctionError
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v
+
+PERCENTILES = (50, 90, 95, 99)
+QUERY_RING = 4
+
+_counting_widget = None
+_patched_modules = 0
+
+
+def _counting(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        widget = _counting_widget
+        if widget is not None:
+            widget._frame_calls += 1
+        return func(*args, **kwargs)
+    wrapper._gl_counted = func
+    return wrapper
+
+
+def install_call_counter():
+    # Every module that did ``from OpenGL.GL import *`` holds its own references
+    # to the entry points, so the counting wrappers are patched into each of
+    # them. The patching is process-wide and cannot be undone: the wrappers
+    # stay in place after stats are disabled, and only count while a widget
+    # with call counting is inside its paintGL. Modules imported later are
+    # picked up by calling this again; repeated calls skip what is patched.
+    global _patched_modules
+    originals = {name: getattr(GL, name) for name in dir(GL)
+                 if name.startswith('gl') and callable(getattr(GL, name))}
+    wrappers = {}
+    modules = list(sys.modules.values())
+    for module in modules:
+        namespace = getattr(module, '__dict__', None)
+        module_name = getattr(module, '__name__', '')
+        if namespace is None or module_name == __name__ or module_name.startswith('OpenGL'):
+            continue
+        for name, func in originals.items():
+            if namespace.get(name) is func:
+                if name not in wrappers:
+                    wrappers[name] = _counting(func)
+                namespace[name] = wrappers[name]
+    _patched_modules = len(modules)
+
+
+class FrameStats:
+    def __init__(self, history=1000):
+        self.records = deque(maxlen=history)
+
+    def add(self, label, start, cpu_ms, gpu_ms, calls):
+        self.records.append((label, start, cpu_ms, gpu_ms, calls))
+
+    def set_gpu_time(self, start, gpu_ms):
+        for i in range(len(self.records) - 1, -1, -1):
+            record = self.records[i]
+            if record[1] == start:
+                self.records[i] = record[:3] + (gpu_ms,) + record[4:]
+                break
+
+    def select(self, label=None):
+        return [r for r in self.records if label is None or r[0] == label]
+
+    def labels(self):
+        return sorted({r[0] for r in self.records if r[0] is not None})
+
+    def fps(self, label=None):
+        records = self.select(label)
+        if len(records) < 2:
+            return 0.0
+        span = records[-1][1] - records[0][1]
+        return (len(records) - 1) / span if span > 0 else 0.0
+
+    def series(self, metric, label=None):
+        column = {'cpu_ms': 2, 'gpu_ms': 3, 'gl_calls': 4}[metric]
+        values = [r[column] for r in self.select(label) if r[column] is not None]
+        return np.array(values, dtype=np.float64)
+
+    def describe(self, metric, label=None):
+        values = self.series(metric, label)
+        if values.size == 0:
+            return None
+        result = {'mean': float(values.mean()), 'max': float(values.max())}
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            result['p%d' % p] = float(v)
+        return result
+
+    def histogram(self, metric, bins=20, label=None):
+        counts, edges = np.histogram(self.series(metric, label), bins=bins)
+        return counts.tolist(), edges.tolist()
+
+    def summary(self, label=None):
+        return {
+            'frames': len(self.select(label)),
+            'fps': self.fps(label),
+            'cpu_ms': self.describe('cpu_ms', label),
+            'gpu_ms': self.describe('gpu_ms', label),
+            'gl_calls': self.describe('gl_calls', label),
+        }
+
+    def to_dict(self):
+        return {
+            'overall': self.summary(),
+            'labels': {label: self.summary(label) for label in self.labels()},
+        }
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def overlay_text(self, label=None):
+        s = self.summary(label)
+        text = 'fps %.1f' % s['fps']
+        if s['cpu_ms']:
+            text += '  cpu %.2f ms (p95 %.2f)' % (s['cpu_ms']['mean'], s['cpu_ms']['p95'])
+        if s['gpu_ms']:
+            text += '  gpu %.2f ms' % s['gpu_ms']['mean']
+        if s['gl_calls']:
+            text += '  calls %d' % s['gl_calls']['mean']
+        return text
+
+
+def _qt_gui(widget):
+    for cls in type(widget).__mro__:
+        if cls.__module__.startswith(('PyQt5.', 'PyQt6.')):
+            return importlib.import_module(cls.__module__.split('.')[0] + '.QtGui')
+    raise RuntimeError('%s is not a Qt widget' % type(widget).__name__)
+
+
+def _instrumented(paint):
+    @functools.wraps(paint)
+    def paintGL(self):
+        if not getattr(self, 'frame_stats_enabled', False):
+            paint(self)
+            if self.frame_capture is not None:
+                self._capture_frame()
+            return
+        self._begin_frame()
+        paint(self)
+        if self.frame_capture is not None:
+            self._capture_frame()
+        self._end_frame()
+    paintGL._instrumented = True
+    return paintGL
+
+
+class FrameStatsMixin:
+    frame_stats_enabled = False
+    frame_stats_overlay = False
+    frame_capture = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        paint = cls.__dict__.get('paintGL')
+        if paint is not None and not getattr(paint, '_instrumented', False):
+            cls.paintGL = _instrumented(paint)
+
+    def enable_frame_stats(self, count_calls=True, gpu=True, overlay=False, history=1000):
+        self.frame_stats = FrameStats(history)
+        self.frame_stats_enabled = True
+        self.frame_stats_overlay = overlay
+        self._gpu_timing = gpu
+        self._gpu_queries = None
+        self._gpu_pending = deque()
+        self._gpu_warm = False
+        self._count_calls = count_calls
+        if count_calls:
+            install_call_counter()
+
+    def disable_frame_stats(self):
+        self.frame_stats_enabled = False
+
+    def frame_label(self):
+        return None
+
+    def _begin_frame(self):
+        global _counting_widget
+        self._collect_gpu_times()
+        if self._count_calls:
+            if len(sys.modules) != _patched_modules:
+                install_call_counter()
+            # Calls are counted for the widget being painted, not process-wide.
+            self._frame_calls = 0
+            _counting_widget = self
+        self._frame_start = time.perf_counter()
+        self._query = self._next_query()
+        if self._query is not None:
+            glBeginQuery(GL_TIME_ELAPSED, self._query)
+
+    def _end_frame(self):
+        global _counting_widget
+        if self._query is not None:
+            glEndQuery(GL_TIME_ELAPSED)
+            self._gpu_pending.append((self._query, self._frame_start))
+        cpu_ms = (time.perf_counter() - self._frame_start) * 1000.0
+        calls = None
+        if self._count_calls:
+            calls = self._frame_calls
+            _counting_widget = None
+        self.frame_stats.add(self.frame_label(), self._frame_start, cpu_ms, None, calls)
+        if self.frame_stats_overlay:
+            self._draw_overlay()
+
+    def _next_query(self):
+        if not self._gpu_timing:
+            return None
+        if self._gpu_queries is None:
+            try:
+                probe = glGenQueries(1)[0]
+                glBeginQuery(GL_TIME_ELAPSED, probe)
+                glEndQuery(GL_TIME_ELAPSED)
+                glGetQueryObjectuiv(probe, GL_QUERY_RESULT)
+                glDeleteQueries(1, [probe])
+                self._gpu_queries = deque(glGenQueries(QUERY_RING))
+            except (GLError, NullFunctionError):
+                self._gpu_timing = False
+                return None
+        if not self._gpu_queries:
+            return None
+        return self._gpu_queries.popleft()
+
+    def _collect_gpu_times(self):
+        while self._gpu_pending:
+            query, start = self._gpu_pending[0]
+            if not glGetQueryObjectuiv(query, GL_QUERY_RESULT_AVAILABLE):
+                break
+            self._gpu_pending.popleft()
+            elapsed = ctypes.c_uint64()
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(elapsed))
+            # The first timer query on a context includes upload and shader
+            # compilation work (and is garbage on some Mesa drivers).
+            if self._gpu_warm:
+                self.frame_stats.set_gpu_time(start, elapsed.value / 1e6)
+            self._gpu_warm = True
+            self._gpu_queries.append(query)
+
+    def _capture_frame(self):
+        if self.frame_capture.closed:
+            return
+        if not self.frame_capture.started and self.context() is not None:
+            # The PBO ring lives in this context, so the frames still in it
+            # are read back before the context goes away.
+            self.context().aboutToBeDestroyed.connect(self._finish_capture)
+        self.frame_capture.capture()
+
+    def _finish_capture(self):
+        self.makeCurrent()
+        self.frame_capture.close()
+        self.doneCurrent()
+
+    def _draw_overlay(self):
+        QtGui = _qt_gui(self)
+        try:
+            glPushAttrib(GL_ALL_ATTRIB_BITS)
+            glPushClientAttrib(GL_CLIENT_ALL_ATTRIB_BITS)
+            pushed = True
+        except (GLError, NullFunctionError):
+            # Core profile: there is no attribute stack to restore from.
+            pushed = False
+        painter = QtGui.QPainter(self)
+        painter.setPen(QtGui.QColor(255, 255, 255))
+        painter.drawText(8, 16, self.frame_stats.overlay_text(self.frame_label()))
+        painter.end()
+        glUseProgram(0)
+        if pushed:
+            glPopClientAttrib()
+            glPopAttrib()
+        # QPainter binds its own program, buffers and textures; the attribute
+        # stack does not cover those, so the tracked copies are dropped.
+        state = getattr(self, 'gl_state', None)
+        if state is not None:
+            state.invalidate()
+
+
+def enable_from_environment(widget):
+    if not os.environ.get('FRAME_STATS'):
+        return
+    widget.enable_frame_stats(overlay=os.environ.get('FRAME_STATS_OVERLAY', '1') != '0')
+    path = os.environ.get('FRAME_STATS_JSON')
+    if path:
+        atexit.register(lambda: widget.frame_stats.dump_json(path))
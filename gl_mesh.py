@@ -0,0 +1,215 @@
+import ctypes
+
+import numpy as np
+from OpenGL.GL import *
+
+STRIDE = 9 * 4
+
+
+class MeshBuffer:
+    # Fill and point modes draw the indexed triangles. Line mode draws the
+    # same triangles unindexed from a second buffer under the caller's
+    # glPolygonMode(GL_LINE), with edge flags clearing every edge that is
+    # not in mesh.edges, the way GL outlines GL_QUADS and GL_POLYGON: the
+    # wireframe has no triangulation diagonals. A shared edge is flagged on
+    # the first face that has it only: drawn once per face, the two lines
+    # z-fight pixel by pixel, and which face's lighting wins then depends on
+    # the rounding of the vertex transform, which differs between the fixed
+    # pipeline and the instancing shader.
+    def __init__(self, mesh):
+        vertices = mesh.interleaved()
+        indices = np.ascontiguousarray(mesh.triangles.ravel())
+
+        self.vertex_count = mesh.vertex_count
+        self.bounds = mesh.bounding_sphere()
+        self.triangle_count = mesh.triangles.size
+
+        corners = mesh.triangles.astype(np.int64)
+        following = np.roll(corners, -1, axis=1)
+        n = mesh.vertex_count
+        outline = np.sort(mesh.edges.astype(np.int64), axis=1) @ [n, 1]
+        sides = np.minimum(corners, following) * n + np.maximum(corners, following)
+        outlined = np.isin(sides, outline).ravel()
+        # Faces carry their own copies of shared corners, so edges are matched
+        # by position.
+        place = np.unique(mesh.positions, axis=0, return_inverse=True)[1].reshape(-1)
+        start, end = place[corners], place[following]
+        shared = np.where(outlined, (np.minimum(start, end) * n + np.maximum(start, end)).ravel(), -1)
+        first = np.zeros(shared.size, dtype=bool)
+        first[np.unique(shared, return_index=True)[1]] = True
+        flags = np.ascontiguousarray(outlined & first, dtype=np.uint8)
+        wire = np.ascontiguousarray(vertices[corners.ravel()])
+        self.wire_count = len(wire)
+        self.flag_offset = wire.nbytes
+
+        self.vbo, self.wire_vbo = glGenBuffers(2)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, self.wire_vbo)
+        glBufferData(GL_ARRAY_BUFFER, wire.nbytes + flags.nbytes, None, GL_STATIC_DRAW)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, wire.nbytes, wire)
+        glBufferSubData(GL_ARRAY_BUFFER, self.flag_offset, flags.nbytes, flags)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self.ibo = glGenBuffers(1)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def bind(self, mode='fill'):
+        if mode == 'line':
+            glBindBuffer(GL_ARRAY_BUFFER, self.wire_vbo)
+            glEnableClientState(GL_EDGE_FLAG_ARRAY)
+            glEdgeFlagPointer(0, ctypes.c_void_p(self.flag_offset))
+        else:
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, STRIDE, ctypes.c_void_p(0))
+        glNormalPointer(GL_FLOAT, STRIDE, ctypes.c_void_p(12))
+        glColorPointer(3, GL_FLOAT, STRIDE, ctypes.c_void_p(24))
+
+    def unbind(self):
+        glDisableClientState(GL_EDGE_FLAG_ARRAY)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_NORMAL_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, mode='fill'):
+        self.bind(mode)
+        self.draw_elements(mode)
+        self.unbind()
+
+    def draw_elements(self, mode='fill'):
+        if mode == 'line':
+            glDrawArrays(GL_TRIANGLES, 0, self.wire_count)
+        else:
+            glDrawElements(GL_TRIANGLES, self.triangle_count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+
+    def draw_instanced(self, instances, mode='fill'):
+        self.bind(mode)
+        instances.bind()
+        if mode == 'line':
+            glDrawArraysInstanced(GL_TRIANGLES, 0, self.wire_count, instances.count)
+        else:
+            glDrawElementsInstanced(GL_TRIANGLES, self.triangle_count, GL_UNSIGNED_INT,
+                                    ctypes.c_void_p(0), instances.count)
+        instances.unbind()
+        self.unbind()
+
+    def delete(self):
+        glDeleteBuffers(3, [self.vbo, self.wire_vbo, self.ibo])
+        self.vbo = None
+        self.wire_vbo = None
+        self.ibo = None
+
+
+def draw_mesh(mesh, mode='fill', colors=None):
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glEnableClientState(GL_NORMAL_ARRAY)
+    glEnableClientState(GL_COLOR_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, mesh.positions)
+    glNormalPointer(GL_FLOAT, 0, mesh.normals)
+    glColorPointer(3, GL_FLOAT, 0, mesh.colors if colors is None else colors)
+    if mode == 'line':
+        glDrawElements(GL_LINES, mesh.edges.size, GL_UNSIGNED_INT, mesh.edges)
+    else:
+        glDrawElements(GL_TRIANGLES, mesh.triangles.size, GL_UNSIGNED_INT, mesh.triangles)
+    glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_NORMAL_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+
+class InstanceBuffer:
+    # Per-instance attributes: a mat4 transform in four consecutive locations
+    # starting at matrix_location, then an RGB color at color_location.
+    STRIDE = 19 * 4
+
+    def __init__(self, data, matrix_location=3, color_location=7):
+        self.matrix_location = matrix_location
+        self.color_location = color_location
+        self.count = len(data)
+        self.vbo = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, np.ascontiguousarray(data), GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def locations(self):
+        return [self.matrix_location + i for i in range(4)] + [self.color_location]
+
+    def bind(self):
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        for i in range(4):
+            location = self.matrix_location + i
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, 4, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(16 * i))
+            glVertexAttribDivisor(location, 1)
+        glEnableVertexAttribArray(self.color_location)
+        glVertexAttribPointer(self.color_location, 3, GL_FLOAT, GL_FALSE, self.STRIDE, ctypes.c_void_p(64))
+        glVertexAttribDivisor(self.color_location, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def unbind(self):
+        for location in self.locations():
+            glVertexAttribDivisor(location, 0)
+            glDisableVertexAttribArray(location)
+
+    def delete(self):
+        glDeleteBuffers(1, [self.vbo])
+        self.vbo = None
+
+
+class VertexArray:
+    # Core-profile geometry: interleaved float attributes in one buffer,
+    # described once by (location, size) pairs and recorded in a VAO
+    # together with the index buffer.
+    def __init__(self, vertices, indices, attributes):
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32)
+        self.vertices = vertices.copy()
+        self.count = indices.size
+
+        self.vao = glGenVertexArrays(1)
+        self.vbo, self.ibo = glGenBuffers(2)
+        glBindVertexArray(self.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_DYNAMIC_DRAW)
+        stride = vertices.shape[1] * 4
+        offset = 0
+        for location, size in attributes:
+            glEnableVertexAttribArray(location)
+            glVertexAttribPointer(location, size, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(offset))
+            offset += size * 4
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def update(self, vertices):
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        if np.array_equal(vertices, self.vertices):
+            return False
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glBufferSubData(GL_ARRAY_BUFFER, 0, vertices.nbytes, vertices)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        self.vertices = vertices.copy()
+        return True
+
+    def draw_elements(self):
+        glDrawElements(GL_TRIANGLES, self.count, GL_UNSIGNED_INT, ctypes.c_void_p(0))
+
+    def draw(self):
+        glBindVertexArray(self.vao)
+        self.draw_elements()
+        glBindVertexArray(0)
+
+    def delete(self):
+        glDeleteVertexArrays(1, [self.vao])
+        glDeleteBuffers(2, [self.vbo, self.ibo])
+        self.vao = None
+        self.vbo = None
+        self.ibo = None
@@ -0,0 +1,99 @@
+from collections import Counter
+
+from OpenGL.GL import *
+
+_UNKNOWN = object()
+
+
+class GLState:
+    # Shadow copy of the fixed-function state the labs set every frame. A call
+    # that would not change the cached value is dropped and counted, so only
+    # real transitions reach the driver. Anything that changes this state
+    # behind the tracker's back must call forget()/invalidate() afterwards;
+    # glPushAttrib/glPopAttrib pairs restore it and need nothing.
+    def __init__(self):
+        self.values = {}
+        self.calls = 0
+        self.elided = 0
+        self.elided_by = Counter()
+
+    def invalidate(self):
+        self.values.clear()
+
+    def forget(self, *key):
+        self.values.pop(key, None)
+
+    def reset_counters(self):
+        self.calls = 0
+        self.elided = 0
+        self.elided_by.clear()
+
+    def _set(self, key, value, func, *args):
+        if self.values.get(key, _UNKNOWN) == value:
+            self.elided += 1
+            self.elided_by[key[0]] += 1
+            return False
+        func(*args)
+        self.values[key] = value
+        self.calls += 1
+        return True
+
+    def enable(self, cap):
+        return self._set(('enable', cap), True, glEnable, cap)
+
+    def disable(self, cap):
+        return self._set(('enable', cap), False, glDisable, cap)
+
+    def polygon_mode(self, face, mode):
+        faces = (GL_FRONT, GL_BACK) if face == GL_FRONT_AND_BACK else (face,)
+        if all(self.values.get(('polygon_mode', f), _UNKNOWN) == mode for f in faces):
+            self.elided += 1
+            self.elided_by['polygon_mode'] += 1
+            return False
+        glPolygonMode(face, mode)
+        for f in faces:
+            self.values[('polygon_mode', f)] = mode
+        self.calls += 1
+        return True
+
+    def point_size(self, size):
+        return self._set(('point_size',), size, glPointSize, size)
+
+    def line_width(self, width):
+        return self._set(('line_width',), width, glLineWidth, width)
+
+    def bind_texture(self, target, texture):
+        return self._set(('bind_texture', target), texture, glBindTexture, target, texture)
+
+    def delete_textures(self, textures):
+        glDeleteTextures(textures)
+        # Deleting the bound texture reverts the binding to 0, and the name
+        # may be handed out again by the next glGenTextures.
+        for key, value in list(self.values.items()):
+            if key[0] == 'bind_texture' and value in textures:
+                self.values[key] = 0
+
+    def use_program(self, program):
+        return self._set(('program',), program, glUseProgram, program)
+
+    def bind_vertex_array(self, vao):
+        return self._set(('vertex_array',), vao, glBindVertexArray, vao)
+
+    def tex_env(self, target, pname, param):
+        return self._set(('tex_env', target, pname), param, glTexEnvi, target, pname, param)
+
+    def texture_scale(self, scale):
+        # The texture matrix is only ever identity or a uniform scale here, so
+        # the scale factor stands in for the whole matrix.
+        return self._set(('texture_matrix',), scale, load_texture_scale, scale)
+
+    def summary(self):
+        return {'calls': self.calls, 'elided': self.elided, 'elided_by': dict(self.elided_by)}
+
+
+def load_texture_scale(scale):
+    glMatrixMode(GL_TEXTURE)
+    glLoadIdentity()
+    if scale != 1.0:
+        glScalef(scale, scale, scale)
+    glMatrixMode(GL_MODELVIEW)
@@ -0,0 +1,341 @@
+import argparse
+import ctypes
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+BACKEND = os.environ.get('HEADLESS_BACKEND', 'qt')
+if BACKEND == 'egl' and 'OpenGL' not in sys.modules:
+    os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+    os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from OpenGL.GL import *
+
+from capture import CAPTURE_FORMATS, FrameCapture
+from frame_scheduler import ManualClock
+from rasterizer import Rasterizer
+
+LABS = {
+    'lab2': 'PyQt5',
+    'lab3': 'PyQt5',
+    'lab4': 'PyQt6',
+}
+LAB2_SHAPES = ('cube', 'prism', 'pyramid')
+LAB2_MODES = ('fill', 'line', 'point')
+LAB3_TASKS = (1, 2, 3, 4, 5)
+LAB4_TEXTURES = ('file', 'checkerboard', 'pattern', 'atlas')
+
+
+def all_scenes():
+    scenes = ['lab2:%s:%s' % (shape, mode) for shape in LAB2_SHAPES for mode in LAB2_MODES]
+    scenes += ['lab3:%d' % task for task in LAB3_TASKS]
+    scenes += ['lab4:%s' % texture for texture in LAB4_TEXTURES]
+    return scenes
+
+
+def binding(scene):
+    return LABS[scene.split(':')[0]]
+
+
+class EglContext:
+    def __init__(self, width, height):
+        from OpenGL import EGL
+        self.EGL = EGL
+        self.display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        major, minor = EGL.EGLint(), EGL.EGLint()
+        if not EGL.eglInitialize(self.display, ctypes.pointer(major), ctypes.pointer(minor)):
+            raise RuntimeError('eglInitialize failed')
+        attributes = (EGL.EGLint * 11)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_RED_SIZE, 8, EGL.EGL_GREEN_SIZE, 8, EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_NONE)
+        config, count = EGL.EGLConfig(), EGL.EGLint()
+        EGL.eglChooseConfig(self.display, attributes, ctypes.pointer(config), 1, ctypes.pointer(count))
+        if count.value == 0:
+            raise RuntimeError('No EGL config with desktop OpenGL support')
+        self.surface = EGL.eglCreatePbufferSurface(
+            self.display, config, (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE))
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        self.context = EGL.eglCreateContext(self.display, config, EGL.EGL_NO_CONTEXT, None)
+        self.make_current()
+        self.fbo = _create_framebuffer(width, height)
+
+    def make_current(self):
+        self.EGL.eglMakeCurrent(self.display, self.surface, self.surface, self.context)
+
+    def bind(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+
+    def release(self):
+        self.EGL.eglMakeCurrent(self.display, self.EGL.EGL_NO_SURFACE, self.EGL.EGL_NO_SURFACE,
+                                self.EGL.EGL_NO_CONTEXT)
+        self.EGL.eglDestroyContext(self.display, self.context)
+        self.EGL.eglDestroySurface(self.display, self.surface)
+
+
+def _create_framebuffer(width, height):
+    fbo = glGenFramebuffers(1)
+    glBindFramebuffer(GL_FRAMEBUFFER, fbo)
+    color, depth = glGenRenderbuffers(2)
+    glBindRenderbuffer(GL_RENDERBUFFER, color)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, color)
+    glBindRenderbuffer(GL_RENDERBUFFER, depth)
+    glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH24_STENCIL8, width, height)
+    glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_STENCIL_ATTACHMENT, GL_RENDERBUFFER, depth)
+    if glCheckFramebufferStatus(GL_FRAMEBUFFER) != GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError('Offscreen framebuffer is incomplete')
+    return fbo
+
+
+class QtContext:
+    def __init__(self, qt, width, height):
+        QtGui = importlib.import_module(qt + '.QtGui')
+        if qt == 'PyQt5':
+            Fbo = QtGui.QOpenGLFramebufferObject
+            attachment = Fbo.CombinedDepthStencil
+        else:
+            Fbo = importlib.import_module(qt + '.QtOpenGL').QOpenGLFramebufferObject
+            attachment = Fbo.Attachment.CombinedDepthStencil
+        surface_format = QtGui.QSurfaceFormat()
+        surface_format.setDepthBufferSize(24)
+        self.context = QtGui.QOpenGLContext()
+        self.context.setFormat(surface_format)
+        if not self.context.create():
+            raise RuntimeError('Could not create an OpenGL context on the %s platform' %
+                               os.environ.get('QT_QPA_PLATFORM'))
+        self.surface = QtGui.QOffscreenSurface()
+        self.surface.setFormat(self.context.format())
+        self.surface.create()
+        self.make_current()
+        self.fbo = Fbo(width, height, attachment)
+
+    def make_current(self):
+        if not self.context.makeCurrent(self.surface):
+            raise RuntimeError('Could not make the offscreen context current')
+
+    def bind(self):
+        self.fbo.bind()
+
+    def release(self):
+        self.fbo.release()
+        self.context.doneCurrent()
+
+
+_application = None
+
+
+def application(qt):
+    global _application
+    QtWidgets = importlib.import_module(qt + '.QtWidgets')
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        app = _application = QtWidgets.QApplication([sys.argv[0]])
+    return app
+
+
+def create_context(qt, width, height, backend=BACKEND):
+    if backend == 'egl':
+        return EglContext(width, height)
+    return QtContext(qt, width, height)
+
+
+def create_widget(scene):
+    parts = scene.split(':')
+    lab = importlib.import_module(parts[0])
+    if parts[0] in ('lab2', 'lab3'):
+        widget = lab.OpenGLWidget()
+        widget.scheduler.set_clock(ManualClock())
+        widget.scheduler.reset()
+        if parts[0] == 'lab2':
+            widget.shape_type = parts[1]
+            widget.render_mode = parts[2] if len(parts) > 2 else 'fill'
+            if len(parts) > 3:
+                widget.stress_count = int(parts[3])
+                widget.stress_layout = parts[4] if len(parts) > 4 else 'grid'
+        else:
+            widget.task = int(parts[1])
+    else:
+        widget = lab.GLWidget()
+    return widget
+
+
+def select_texture(widget, texture, upload=True):
+    if texture == 'file':
+        widget.load_bmp_texture('media/texture.bmp')
+    elif texture == 'checkerboard':
+        widget.calculate_checkerboard_texture()
+    elif texture == 'pattern':
+        widget.calculate_pattern_texture()
+    elif texture == 'atlas':
+        widget.build_texture_atlas()
+    widget.texture_source = texture
+    if upload:
+        widget.setup_texture()
+
+
+def advance(widget):
+    if hasattr(widget, 'scheduler'):
+        widget.scheduler.clock.tick(1.0 / widget.scheduler.degrees_per_second)
+        widget.updateRotation()
+    else:
+        widget.angle_y += 1.0
+
+
+def read_frame(width, height):
+    glPixelStorei(GL_PACK_ALIGNMENT, 1)
+    data = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)[::-1]
+
+
+def render_scene(scene, frames=1, width=640, height=480, backend=BACKEND, setup=None, capture=None):
+    qt = binding(scene)
+    other = 'PyQt6' if qt == 'PyQt5' else 'PyQt5'
+    if other in sys.modules:
+        raise RuntimeError('%s is already loaded; render %s scenes in a separate process' % (other, qt))
+
+    application(qt)
+    widget = create_widget(scene)
+    widget.resize(width, height)
+    # The software backend never touches GL: widgets are constructed but not
+    # initialized, and each frame is rasterized from their state in NumPy.
+    software = backend == 'software'
+    raster = Rasterizer(width, height) if software else None
+    context = None if software else create_context(qt, width, height, backend)
+    try:
+        if not software:
+            context.bind()
+            widget.initializeGL()
+            widget.resizeGL(width, height)
+        if scene.startswith('lab4:'):
+            select_texture(widget, scene.split(':')[1], upload=not software)
+        if setup is not None:
+            setup(widget)
+
+        # Captured frames go to the capture's encoders instead of being kept.
+        images = None if capture is not None else np.empty((frames, height, width, 3), dtype=np.uint8)
+        render_ms = []
+        readback_ms = []
+        state_calls = []
+        state_elided = []
+        state = None if software else getattr(widget, 'gl_state', None)
+        for i in range(frames):
+            if state is not None:
+                state.reset_counters()
+            start = time.perf_counter()
+            if software:
+                widget.render_software(raster)
+                rendered = time.perf_counter()
+                images[i] = raster.image()
+            else:
+                context.bind()
+                widget.paintGL()
+                if capture is not None:
+                    # No glFinish: the readback is queued behind the frame.
+                    rendered = time.perf_counter()
+                    capture.capture()
+                else:
+                    glFinish()
+                    rendered = time.perf_counter()
+                    images[i] = read_frame(width, height)
+            render_ms.append((rendered - start) * 1000.0)
+            readback_ms.append((time.perf_counter() - rendered) * 1000.0)
+            if state is not None:
+                state_calls.append(state.calls)
+                state_elided.append(state.elided)
+            advance(widget)
+        if capture is not None:
+            capture.close()
+    finally:
+        if context is not None:
+            context.release()
+
+    timings = {'render_ms': render_ms, 'readback_ms': readback_ms}
+    if state is not None:
+        timings['state_calls'] = state_calls
+        timings['state_elided'] = state_elided
+    return images, timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render lab scenes offscreen.')
+    parser.add_argument('scenes', nargs='*', help='lab2:<shape>:<mode>[:<instances>[:<layout>]], lab3:<task> or lab4:<texture>; all by default')
+    parser.add_argument('--frames', type=int, default=10)
+    parser.add_argument('--size', default='640x480')
+    parser.add_argument('--out', help='directory for one .npz per scene')
+    parser.add_argument('--capture', help='encode every frame into <dir>/<scene>/ instead of keeping it')
+    parser.add_argument('--capture-format', choices=CAPTURE_FORMATS, default='png')
+    parser.add_argument('--reference', action='store_true',
+                        help='also rasterize each scene in software and report the image difference')
+    args = parser.parse_args(argv)
+
+    scenes = args.scenes or all_scenes()
+    bindings = sorted({binding(scene) for scene in scenes})
+    if len(bindings) > 1:
+        status = 0
+        for qt in bindings:
+            group = [scene for scene in scenes if binding(scene) == qt]
+            command = [sys.executable, os.path.abspath(__file__), *group,
+                       '--frames', str(args.frames), '--size', args.size]
+            if args.out:
+                command += ['--out', args.out]
+            if args.capture:
+                command += ['--capture', args.capture, '--capture-format', args.capture_format]
+            if args.reference:
+                command.append('--reference')
+            status |= subprocess.call(command)
+        return status
+
+    if args.capture and BACKEND == 'software':
+        parser.error('--capture reads frames back from GL and needs the qt or egl backend')
+    width, height = (int(v) for v in args.size.split('x'))
+    for scene in scenes:
+        capture = None
+        if args.capture:
+            capture = FrameCapture(os.path.join(args.capture, scene.replace(':', '_')), args.capture_format)
+        start = time.perf_counter()
+        try:
+            images, timings = render_scene(scene, args.frames, width, height, capture=capture)
+        except ValueError as e:
+            # A scene the backend cannot draw; the rest of the group still runs.
+            print('%-20s skipped: %s' % (scene, e))
+            continue
+        elapsed = time.perf_counter() - start
+        render_ms = np.array(timings['render_ms'])
+        line = '%-20s %3d frames  render %.2f ms (p95 %.2f)  readback %.2f ms' % (
+            scene, len(render_ms), render_ms.mean(), np.percentile(render_ms, 95),
+            np.mean(timings['readback_ms']))
+        if capture is not None:
+            stats = capture.stats
+            line += '  captured %d in %.1f s, %d stalls (%.1f ms)' % (
+                stats['encoded'], elapsed, stats['stalls'], stats['stall_ms'])
+            print(line)
+            continue
+        if 'state_elided' in timings:
+            line += '  state calls %.1f/frame, elided %.1f/frame' % (
+                np.mean(timings['state_calls']), np.mean(timings['state_elided']))
+        arrays = dict(timings)
+        if args.reference and BACKEND != 'software':
+            try:
+                reference, _ = render_scene(scene, args.frames, width, height, backend='software')
+            except ValueError as e:
+                line += '  reference: %s' % e
+            else:
+                diff = np.abs(images.astype(np.int16) - reference).max(axis=-1)
+                line += '  reference diff %.2f (%.2f%% px > 16)' % (diff.mean(), 100.0 * (diff > 16).mean())
+                arrays['reference'] = reference
+        print(line)
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            np.savez_compressed(os.path.join(args.out, scene.replace(':', '_') + '.npz'),
+                                frames=images, **arrays)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
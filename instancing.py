@@ -0,0 +1,85 @@
+import numpy as np
+
+from meshes import Mesh
+
+MAX_INSTANCES = 100000
+LAYOUTS = ('grid', 'random')
+
+
+def rotation_matrices(axes, angles):
+    axes = axes / np.linalg.norm(axes, axis=1, keepdims=True)
+    x, y, z = axes.T
+    c = np.cos(angles)
+    s = np.sin(angles)
+    t = 1.0 - c
+    return np.stack([
+        np.stack([t * x * x + c, t * x * y - s * z, t * x * z + s * y], axis=-1),
+        np.stack([t * x * y + s * z, t * y * y + c, t * y * z - s * x], axis=-1),
+        np.stack([t * x * z - s * y, t * y * z + s * x, t * z * z + c], axis=-1),
+    ], axis=1)
+
+
+def transforms(positions, axes, angles, scale):
+    n = len(positions)
+    matrices = np.zeros((n, 4, 4), dtype=np.float32)
+    matrices[:, :3, :3] = rotation_matrices(axes, angles) * scale
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def grid_layout(n, extent=1.2, seed=0):
+    side = max(1, int(np.ceil(round(n ** (1.0 / 3.0), 6))))
+    index = np.arange(n)
+    cells = np.stack([index % side, (index // side) % side, index // (side * side)], axis=1)
+    spacing = 2.0 * extent / side
+    positions = (cells + 0.5) * spacing - extent
+    # Instances share one orientation so the grid reads as a block; colors run
+    # along the axes so neighbouring cells stay distinguishable.
+    axes = np.broadcast_to((1.0, 1.0, 1.0), (n, 3))
+    angles = np.zeros(n)
+    colors = (cells + 0.5) / side
+    return transforms(positions, axes, angles, spacing * 0.35), colors.astype(np.float32)
+
+
+def random_layout(n, extent=1.2, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-extent, extent, (n, 3))
+    axes = rng.normal(size=(n, 3))
+    angles = rng.uniform(0.0, 2.0 * np.pi, n)
+    colors = rng.uniform(0.2, 1.0, (n, 3))
+    spacing = 2.0 * extent / max(1.0, n ** (1.0 / 3.0))
+    return transforms(positions, axes, angles, spacing * 0.35), colors.astype(np.float32)
+
+
+def layout(name, n, extent=1.2, seed=0):
+    if name == 'grid':
+        return grid_layout(n, extent, seed)
+    if name == 'random':
+        return random_layout(n, extent, seed)
+    raise ValueError('Unknown instance layout: %s' % name)
+
+
+def instance_data(matrices, colors):
+    # One interleaved record per instance: the transform as four columns (the
+    # layout of a GLSL mat4 attribute) followed by the RGB color.
+    data = np.empty((len(matrices), 19), dtype=np.float32)
+    data[:, :16] = matrices.transpose(0, 2, 1).reshape(-1, 16)
+    data[:, 16:] = colors
+    return data
+
+
+def expand(mesh, matrices, colors):
+    # Every instance baked into one mesh, for renderers without instancing.
+    count = len(matrices)
+    linear = matrices[:, :3, :3]
+    positions = np.einsum('kij,vj->kvi', linear, mesh.positions) + matrices[:, np.newaxis, :3, 3]
+    normals = np.einsum('kij,vj->kvi', linear, mesh.normals)
+    offsets = np.arange(count)[:, np.newaxis, np.newaxis] * mesh.vertex_count
+    return Mesh(
+        positions.reshape(-1, 3),
+        normals.reshape(-1, 3),
+        np.repeat(colors, mesh.vertex_count, axis=0),
+        (mesh.triangles + offsets).reshape(-1, 3),
+        (mesh.edges + offsets).reshape(-1, 2),
+    )
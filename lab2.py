@@ -1,189 +1,234 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QOpenGLWidget, QVBoxLayout, QHBoxLayout, QPushButton, QWidget
-from PyQt5.QtCore import QTimer
 from OpenGL.GL import *
-import math
+from OpenGL.error import GLError, NullFunctionError
+from frame_stats import FrameStatsMixin, enable_from_environment
+from frame_scheduler import FrameScheduler
+import capture
+import meshes
+import instancing
+import matrices
+from scene import Material, Node, Scene
+from gl_mesh import InstanceBuffer, MeshBuffer
+from lod import LOD_LEVELS, LodMesh, select_segments
+from gl_state import GLState
+from shaders import ShaderProgram
 
-class OpenGLWidget(QOpenGLWidget):
+POINT_SIZE = 8.0
+LINE_WIDTH = 2.0
+
+INSTANCED_VERTEX = """
+#version 120
+attribute mat4 instanceMatrix;
+attribute vec3 instanceColor;
+void main() {
+    vec3 normal = normalize(gl_NormalMatrix * (mat3(instanceMatrix) * gl_Normal));
+    vec3 light = normalize(gl_LightSource[0].position.xyz);
+    float diffuse = max(dot(normal, light), 0.0);
+    gl_FrontColor = vec4(instanceColor * (gl_LightModel.ambient.rgb + diffuse), 1.0);
+    gl_BackColor = gl_FrontColor;
+    gl_Position = gl_ModelViewProjectionMatrix * (instanceMatrix * gl_Vertex);
+}
+"""
+
+VERTEX_COLOR_FRAGMENT = """
+#version 120
+void main() {
+    gl_FragColor = gl_Color;
+}
+"""
+
+class OpenGLWidget(FrameStatsMixin, QOpenGLWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.angle = 0.0
         self.shape_type = 'cube'
         self.render_mode = 'fill'
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updateRotation)
-        self.timer.start(20)
+        self.segments = 16
+        self.lod = True
+        self.viewport_height = 1
+        self.meshes = {}
+        self.meshes_dirty = True
+        self.projection = matrices.ortho(-1.5, 1.5, -1.5, 1.5, 1, 10)
+        self.material = Material('lit', lighting=True)
+        self.gl_state = GLState()
+        self.scene = Scene(self.gl_state)
+        self.nodes = {}
+        self.stress_count = 0
+        self.stress_layout = 'grid'
+        self.instances = None
+        self.instance_matrices = None
+        self.instance_colors = None
+        self.instances_dirty = True
+        self.use_shaders = True
+        self.instanced_program = None
+        
+        self.scheduler = FrameScheduler(self, self.updateRotation)
+        self.scheduler.start()
+        
+        enable_from_environment(self)
+        capture.enable_from_environment(self)
     
     def initializeGL(self):
-        glEnable(GL_LIGHTING)
-        glEnable(GL_LIGHT0)
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_COLOR_MATERIAL)
+        self.gl_state.invalidate()
+        self.gl_state.enable(GL_LIGHTING)
+        self.gl_state.enable(GL_LIGHT0)
+        self.gl_state.enable(GL_DEPTH_TEST)
+        self.gl_state.enable(GL_COLOR_MATERIAL)
         glClearColor(0.1, 0.0, 0.2, 0.0)
+        # Also runs for a re-created context: the old buffer names died with
+        # it, so they are dropped here instead of deleted by buildMeshes or
+        # buildInstances.
+        self.meshes = {}
+        self.buildMeshes()
+        self.instances = None
+        self.instances_dirty = True
+        
+        instancing_calls = (glVertexAttribDivisor, glDrawElementsInstanced, glDrawArraysInstanced)
+        if self.use_shaders and not all(instancing_calls):
+            print('Instanced rendering unavailable, stress mode draws one call per instance: '
+                  'no instanced draw entry points')
+        elif self.use_shaders:
+            try:
+                self.instanced_program = ShaderProgram(
+                    INSTANCED_VERTEX, VERTEX_COLOR_FRAGMENT,
+                    {3: 'instanceMatrix', 7: 'instanceColor'})
+            except (RuntimeError, GLError, NullFunctionError) as e:
+                print('Instanced rendering unavailable, stress mode draws one call per instance: %s' % e)
+                self.instanced_program = None
         
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        
-        aspect = w / h if h != 0 else 1
-        w_scale = 1.5 * aspect
-        glOrtho(-w_scale, w_scale, -1.5, 1.5, 1, 10)
+        self.projection = self.projectionMatrix(w, h)
+        glLoadMatrixf(self.projection.T)
+        self.viewport_height = h
         
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
     
     def paintGL(self):
+        if self.meshes_dirty:
+            self.buildMeshes()
+        
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glPushMatrix()
         
-        glTranslatef(0.0, 0.0, -8.0)
-        
-        glRotatef(self.angle, 1.0, 1.0, 1.0)
+        view = self.viewMatrix()
+        glMultMatrixf(view.T)
         
+        state = self.gl_state
         if self.render_mode == 'point':
-            glPolygonMode(GL_FRONT_AND_BACK, GL_POINT)
-            glPointSize(8.0)
-            glEnable(GL_POINT_SMOOTH)
+            state.polygon_mode(GL_FRONT_AND_BACK, GL_POINT)
+            state.point_size(POINT_SIZE)
+            state.enable(GL_POINT_SMOOTH)
         elif self.render_mode == 'line':
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-            glLineWidth(2.0)
-            glEnable(GL_LINE_SMOOTH)
+            state.polygon_mode(GL_FRONT_AND_BACK, GL_LINE)
+            state.line_width(LINE_WIDTH)
+            state.enable(GL_LINE_SMOOTH)
         else:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+            state.polygon_mode(GL_FRONT_AND_BACK, GL_FILL)
         
-        if self.shape_type == 'cube':
-            self.drawCube()
-        elif self.shape_type == 'prism':
-            self.drawPrism()
-        elif self.shape_type == 'pyramid':
-            self.drawPyramid()
+        if self.stress_count:
+            self.drawInstances(view)
+        else:
+            for name, node in self.nodes.items():
+                node.visible = name == self.shape_type
+            self.scene.draw(view, self.projection, self.render_mode, self.viewport_height)
         
         glPopMatrix()
     
-    def drawCube(self):
-        h = 1.0
-        
-        glColor3f(1.0, 0.0, 0.0)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 0.0, 1.0)
-        glVertex3f(h, h, h)
-        glVertex3f(-h, h, h)
-        glVertex3f(-h, -h, h)
-        glVertex3f(h, -h, h)
-        glEnd()
-        
-        glColor3f(0.0, 0.0, 1.0)
-        glBegin(GL_QUADS)
-        glNormal3f(1.0, 0.0, 0.0)
-        glVertex3f(h, h, -h)
-        glVertex3f(h, h, h)
-        glVertex3f(h, -h, h)
-        glVertex3f(h, -h, -h)
-        glEnd()
-        
-        glColor3f(0.0, 1.0, 0.0)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 0.0, -1.0)
-        glVertex3f(-h, h, -h)
-        glVertex3f(h, h, -h)
-        glVertex3f(h, -h, -h)
-        glVertex3f(-h, -h, -h)
-        glEnd()
-        
-        glColor3f(1.0, 1.0, 0.0)
-        glBegin(GL_QUADS)
-        glNormal3f(-1.0, 0.0, 0.0)
-        glVertex3f(-h, h, h)
-        glVertex3f(-h, h, -h)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(-h, -h, h)
-        glEnd()
-        
-        glColor3f(1.0, 0.0, 1.0)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 1.0, 0.0)
-        glVertex3f(h, h, h)
-        glVertex3f(h, h, -h)
-        glVertex3f(-h, h, -h)
-        glVertex3f(-h, h, h)
-        glEnd()
-        
-        glColor3f(0.0, 1.0, 1.0)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, -1.0, 0.0)
-        glVertex3f(h, -h, h)
-        glVertex3f(-h, -h, h)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(h, -h, -h)
-        glEnd()
+    def projectionMatrix(self, w, h):
+        aspect = w / h if h != 0 else 1
+        w_scale = 1.5 * aspect
+        return matrices.ortho(-w_scale, w_scale, -1.5, 1.5, 1, 10)
     
-    def drawPrism(self):
-        n = 16
-        h = 1.0
-        r = 0.5
-        delta_fi = 2 * math.pi / n
-        
-        glColor3f(0.0, 1.0, 0.0)
-        glBegin(GL_QUADS)
-        for i in range(n):
-            fi = i * delta_fi
-            nx = math.cos(fi + delta_fi / 2)
-            ny = math.sin(fi + delta_fi / 2)
-            glNormal3f(nx, ny, 0.0)
-            
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), h / 2)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), -h / 2)
-            glVertex3f(r * math.cos(fi + delta_fi), r * math.sin(fi + delta_fi), -h / 2)
-            glVertex3f(r * math.cos(fi + delta_fi), r * math.sin(fi + delta_fi), h / 2)
-        glEnd()
-        
-        glBegin(GL_POLYGON)
-        glColor3f(1.0, 1.0, 0.0)
-        glNormal3f(0, 0, 1)
-        for i in range(n):
-            fi = i * delta_fi
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), h / 2)
-        glEnd()
-        
-        glBegin(GL_POLYGON)
-        glColor3f(1.0, 0.5, 0.0)
-        glNormal3f(0, 0, -1)
-        for i in range(n - 1, -1, -1):
-            fi = i * delta_fi
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), -h / 2)
-        glEnd()
+    def viewMatrix(self):
+        return matrices.translate(0.0, 0.0, -8.0) @ matrices.rotate(self.angle, 1.0, 1.0, 1.0)
     
-    def drawPyramid(self):
-        n = 16
-        h = 1.0
-        r = 0.5
-        delta_fi = 2 * math.pi / n
-        teta = math.atan(h / r)
-        
-        glBegin(GL_TRIANGLES)
-        for i in range(n):
-            fi = i * delta_fi
-            glColor3f((i % 2), ((i % 3) / 2), ((i % 5) / 4))
-            
-            nx = math.cos(fi + delta_fi / 2) * math.sin(teta)
-            ny = math.sin(fi + delta_fi / 2) * math.sin(teta)
-            nz = math.cos(teta)
-            glNormal3f(nx, ny, nz)
-            
-            glVertex3f(0, 0, h)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), 0)
-            glVertex3f(r * math.cos(fi + delta_fi), r * math.sin(fi + delta_fi), 0)
-        glEnd()
-        
-        glBegin(GL_POLYGON)
-        glColor3f(0.8, 0.8, 0.0)
-        glNormal3f(0, 0, -1)
-        for i in range(n - 1, -1, -1):
-            fi = i * delta_fi
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), 0)
-        glEnd()
+    def buildMeshes(self):
+        for mesh in self.meshes.values():
+            mesh.delete()
+        if self.lod:
+            prism = LodMesh(meshes.prism, 0.5, 1.0, 0.5)
+            pyramid = LodMesh(meshes.pyramid, 0.5, 1.0, 0.5)
+        else:
+            prism = MeshBuffer(meshes.prism(self.segments, 1.0, 0.5))
+            pyramid = MeshBuffer(meshes.pyramid(self.segments, 1.0, 0.5))
+        self.meshes = {
+            'cube': MeshBuffer(meshes.cube(1.0)),
+            'prism': prism,
+            'pyramid': pyramid,
+        }
+        self.scene = Scene(self.gl_state)
+        self.nodes = {name: self.scene.add(Node(name, mesh, self.material))
+                      for name, mesh in self.meshes.items()}
+        self.meshes_dirty = False
+    
+    def buildInstances(self):
+        if self.instances is not None:
+            self.instances.delete()
+            self.instances = None
+        transforms, colors = instancing.layout(self.stress_layout, self.stress_count)
+        self.instance_matrices = transforms
+        self.instance_colors = colors
+        if self.instanced_program is not None:
+            self.instances = InstanceBuffer(instancing.instance_data(transforms, colors))
+        self.instances_dirty = False
+    
+    def drawInstances(self, view):
+        if self.instances_dirty:
+            self.buildInstances()
+        mesh = self.meshes[self.shape_type]
+        if isinstance(mesh, LodMesh):
+            # All instances share one scale, so one level fits the whole set.
+            mesh.select(matrices.pixels_per_unit(
+                view @ self.instance_matrices[0], self.projection, self.viewport_height))
+            mesh = mesh.current
+        if self.instanced_program is None:
+            mesh.bind(self.render_mode)
+            glDisableClientState(GL_COLOR_ARRAY)
+            self.gl_state.enable(GL_NORMALIZE)
+            for matrix, color in zip(self.instance_matrices, self.instance_colors):
+                glPushMatrix()
+                glMultMatrixf(matrix.T)
+                glColor3fv(color)
+                mesh.draw_elements(self.render_mode)
+                glPopMatrix()
+            self.gl_state.disable(GL_NORMALIZE)
+            mesh.unbind()
+            return
+        self.instanced_program.use()
+        mesh.draw_instanced(self.instances, self.render_mode)
+        self.instanced_program.release()
+    
+    def render_software(self, raster):
+        raster.clear((0.1, 0.0, 0.2))
+        # GL_LINE_SMOOTH touches one more pixel across the line than an
+        # aliased line, and with blending off every touched pixel is written.
+        size = {'point': POINT_SIZE, 'line': LINE_WIDTH + 1.0}.get(self.render_mode, 1.0)
+        projection = self.projectionMatrix(raster.width, raster.height)
+        view = self.viewMatrix()
+        if not self.stress_count:
+            mesh = self.softwareMesh(view, projection, raster.height)
+            raster.draw_mesh(mesh, view, projection, lighting=True, mode=self.render_mode, size=size)
+            return
+        if self.instances_dirty:
+            self.buildInstances()
+        mesh = self.softwareMesh(view @ self.instance_matrices[0], projection, raster.height)
+        raster.draw_mesh(instancing.expand(mesh, self.instance_matrices, self.instance_colors),
+                         view, projection, lighting=True, mode=self.render_mode, size=size)
+    
+    def softwareMesh(self, modelview, projection, height):
+        if self.shape_type == 'cube':
+            return meshes.cube(1.0)
+        builder = meshes.prism if self.shape_type == 'prism' else meshes.pyramid
+        segments = self.segments
+        if self.lod:
+            center = builder(LOD_LEVELS[-1], 1.0, 0.5).bounding_sphere()[0]
+            segments = select_segments(
+                matrices.pixels_per_unit(modelview, projection, height, center), 0.5)
+        return builder(segments, 1.0, 0.5)
     
     def setShape(self, shape):
         self.shape_type = shape
@@ -193,11 +238,38 @@ class OpenGLWidget(QOpenGLWidget):
         self.render_mode = mode
         self.update()
     
+    def setSegments(self, n):
+        self.segments = n
+        self.lod = False
+        self.meshes_dirty = True
+        self.update()
+    
+    def setLod(self, enabled):
+        self.lod = enabled
+        self.meshes_dirty = True
+        self.update()
+    
+    def setStressCount(self, n):
+        self.stress_count = max(0, min(n, instancing.MAX_INSTANCES))
+        self.instances_dirty = True
+        self.update()
+    
+    def setStressLayout(self, layout):
+        self.stress_layout = layout
+        self.instances_dirty = True
+        self.update()
+    
+    def frame_label(self):
+        mesh = self.meshes.get(self.shape_type)
+        segments = mesh.segments if isinstance(mesh, LodMesh) else self.segments
+        label = '%s/%s/n%d' % (self.shape_type, self.render_mode, segments)
+        if self.stress_count:
+            label += '/x%d-%s' % (self.stress_count, self.stress_layout)
+        return label
+    
     def updateRotation(self):
-            self.angle += 1.0
-            if self.angle >= 360.0:
-                self.angle = 0.0
-            self.update()
+        self.angle = self.scheduler.angle()
+        self.update()
 
 
 class MainWindow(QMainWindow):
@@ -246,6 +318,23 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(render_layout)
         
+        stress_layout = QHBoxLayout()
+        
+        for count, title in ((0, "Одна фігура"), (1000, "1 000"), (10000, "10 000"), (100000, "100 000")):
+            count_btn = QPushButton(title)
+            count_btn.clicked.connect(lambda checked, n=count: self.opengl_widget.setStressCount(n))
+            stress_layout.addWidget(count_btn)
+        
+        grid_btn = QPushButton("Сітка")
+        grid_btn.clicked.connect(lambda: self.opengl_widget.setStressLayout('grid'))
+        stress_layout.addWidget(grid_btn)
+        
+        random_btn = QPushButton("Випадково")
+        random_btn.clicked.connect(lambda: self.opengl_widget.setStressLayout('random'))
+        stress_layout.addWidget(random_btn)
+        
+        layout.addLayout(stress_layout)
+        
         central_widget.setLayout(layout)
 
 
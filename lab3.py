@@ -1,31 +1,116 @@
 import sys
 from PyQt5.QtWidgets import QApplication, QMainWindow, QOpenGLWidget, QVBoxLayout, QHBoxLayout, QPushButton, QWidget
-from PyQt5.QtCore import QTimer
 from OpenGL.GL import *
+from frame_stats import FrameStatsMixin, enable_from_environment
+from frame_scheduler import FrameScheduler
+import capture
 import math
+import numpy as np
+import meshes
+import matrices
+from gl_mesh import MeshBuffer, draw_mesh
+from lod import LodMesh, select_segments
+from gl_state import GLState
+from scene import Callback, Material, Node, Scene
+from OpenGL.error import GLError, NullFunctionError
+from shaders import ShaderProgram
 
-class OpenGLWidget(QOpenGLWidget):
+VERTEX_COLOR_FRAGMENT = """
+#version 120
+void main() {
+    gl_FragColor = gl_Color;
+}
+"""
+
+DYNAMIC_CUBE_VERTEX = """
+#version 120
+uniform float angle;
+void main() {
+    float a = radians(angle);
+    vec3 top = abs(sin(vec3(2.0, 3.0, 5.0) * a));
+    vec3 bottom = abs(sin(vec3(7.0, 11.0, 13.0) * a));
+    gl_FrontColor = vec4(gl_Vertex.y > 0.0 ? top : bottom, 1.0);
+    gl_BackColor = gl_FrontColor;
+    gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+}
+"""
+
+EFFECTS_VERTEX = """
+#version 120
+uniform float angle;
+void main() {
+    float a = radians(angle);
+    float fi = atan(gl_Vertex.y, gl_Vertex.x);
+    if (gl_Vertex.z > 0.0) {
+        gl_FrontColor = vec4(abs(sin(5.0 * a + fi)), 1.0, abs(sin(7.0 * a + fi)), 1.0);
+    } else {
+        gl_FrontColor = vec4(abs(sin(2.0 * a - fi)), 0.0, abs(sin(3.0 * a - fi)), 1.0);
+    }
+    gl_BackColor = gl_FrontColor;
+    gl_Position = gl_ModelViewProjectionMatrix * gl_Vertex;
+}
+"""
+
+COLORED_CUBE_COLORS = (
+    (0.8, 0.4, 0.8), (1.0, 1.0, 0.6), (0.6, 0.3, 0.1),
+    (0.0, 0.5, 0.5), (0.6, 0.0, 0.2), (0.6, 1.0, 0.4),
+)
+
+class OpenGLWidget(FrameStatsMixin, QOpenGLWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.angle = 0.0
         self.task = 1
-        
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updateRotation)
-        self.timer.start(20)
+        self.cube_size = 1.0
+        self.cylinder_segments = 40
+        self.effects_segments = 80
+        self.lod = True
+        self.viewport_height = 1
+        self.geometry = {}
+        self.use_shaders = True
+        self.programs = {}
+        self.projection = matrices.ortho(-1.5, 1.5, -1.5, 1.5, 1, 10)
+        self.materials = {
+            'lit': Material('lit', lighting=True),
+            'unlit': Material('unlit'),
+        }
+        self.gl_state = GLState()
+        self.scene = Scene(self.gl_state)
+        self.taskNodes = {task: self.scene.add(Node('task%d' % task)) for task in range(1, 6)}
+        
+        self.scheduler = FrameScheduler(self, self.updateRotation)
+        self.scheduler.start()
+        
+        enable_from_environment(self)
+        capture.enable_from_environment(self)
     
     def initializeGL(self):
-        glEnable(GL_DEPTH_TEST)
+        # Also runs for a re-created context: buffers from the previous one
+        # are gone with it, so the cache is dropped without deleting them.
+        self.gl_state.invalidate()
+        self.geometry = {}
+        self.gl_state.enable(GL_DEPTH_TEST)
         glClearColor(0.1, 0.0, 0.2, 0.0)
         
+        if self.use_shaders:
+            try:
+                self.programs = {
+                    'dynamicCube': ShaderProgram(DYNAMIC_CUBE_VERTEX, VERTEX_COLOR_FRAGMENT),
+                    'effects': ShaderProgram(EFFECTS_VERTEX, VERTEX_COLOR_FRAGMENT),
+                }
+            except (RuntimeError, GLError, NullFunctionError) as e:
+                print(f"Shader path unavailable, using CPU colors: {e}")
+                self.use_shaders = False
+        
+        for name, program in self.programs.items():
+            self.materials[name] = Material(name, program=program, uniforms={'angle': 0.0})
+        
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        
-        aspect = w / h if h != 0 else 1
-        w_scale = 1.5 * aspect
-        glOrtho(-w_scale, w_scale, -1.5, 1.5, 1, 10)
+        self.projection = self.projectionMatrix(w, h)
+        glLoadMatrixf(self.projection.T)
+        self.viewport_height = h
         
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
@@ -34,152 +119,81 @@ class OpenGLWidget(QOpenGLWidget):
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
         glPushMatrix()
         
-        glTranslatef(0.0, 0.0, -8.0)
-        glRotatef(self.angle, 1.0, 1.0, 1.0)
-        
-        if self.task == 1:
-            self.coloredCube()
-        elif self.task == 2:
-            self.gradientCube()
-        elif self.task == 3:
-            self.dynamicCube()
-        elif self.task == 4:
-            self.cylinder()
-        elif self.task == 5:
-            self.effects()
+        view = self.viewMatrix()
+        glMultMatrixf(view.T)
+        
+        tasks = {
+            1: self.coloredCube,
+            2: self.gradientCube,
+            3: self.dynamicCube,
+            4: self.cylinder,
+            5: self.effects,
+        }
+        for task, node in self.taskNodes.items():
+            node.visible = task == self.task
+        if self.task in tasks:
+            node = self.taskNodes[self.task]
+            node.mesh, node.material = tasks[self.task]()
+            self.scene.draw(view, self.projection, viewport_height=self.viewport_height)
         
         glPopMatrix()
 
-    def coloredCube(self):
-        glEnable(GL_LIGHTING)
-        glEnable(GL_LIGHT0)
-        glEnable(GL_COLOR_MATERIAL)
-        
-        h = 1.0
-
-        glColor3f(0.8, 0.4, 0.8)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 0.0, 1.0)
-        glVertex3f(h, h, h)
-        glVertex3f(-h, h, h)
-        glVertex3f(-h, -h, h)
-        glVertex3f(h, -h, h)
-        glEnd()
-
-        glColor3f(1.0, 1.0, 0.6)
-        glBegin(GL_QUADS)
-        glNormal3f(1.0, 0.0, 0.0)
-        glVertex3f(h, h, -h)
-        glVertex3f(h, h, h)
-        glVertex3f(h, -h, h)
-        glVertex3f(h, -h, -h)
-        glEnd()
-
-        glColor3f(0.6, 0.3, 0.1)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 0.0, -1.0)
-        glVertex3f(-h, h, -h)
-        glVertex3f(h, h, -h)
-        glVertex3f(h, -h, -h)
-        glVertex3f(-h, -h, -h)
-        glEnd()
+    def projectionMatrix(self, w, h):
+        aspect = w / h if h != 0 else 1
+        w_scale = 1.5 * aspect
+        return matrices.ortho(-w_scale, w_scale, -1.5, 1.5, 1, 10)
+    
+    def viewMatrix(self):
+        return matrices.translate(0.0, 0.0, -8.0) @ matrices.rotate(self.angle, 1.0, 1.0, 1.0)
 
-        glColor3f(0.0, 0.5, 0.5)
-        glBegin(GL_QUADS)
-        glNormal3f(-1.0, 0.0, 0.0)
-        glVertex3f(-h, h, h)
-        glVertex3f(-h, h, -h)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(-h, -h, h)
-        glEnd()
+    def staticMesh(self, name, builder, *params):
+        entry = self.geometry.get(name)
+        if entry is None or entry[0] != params:
+            if entry is not None:
+                entry[1].delete()
+            entry = (params, MeshBuffer(builder(*params)))
+            self.geometry[name] = entry
+        return entry[1]
 
-        glColor3f(0.6, 0.0, 0.2)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, 1.0, 0.0)
-        glVertex3f(h, h, h)
-        glVertex3f(h, h, -h)
-        glVertex3f(-h, h, -h)
-        glVertex3f(-h, h, h)
-        glEnd()
+    def lodMesh(self, name, builder, radius, *params):
+        entry = self.geometry.get(name)
+        if entry is None or entry[0] != params:
+            if entry is not None:
+                entry[1].delete()
+            entry = (params, LodMesh(builder, radius, *params))
+            self.geometry[name] = entry
+        return entry[1]
 
-        glColor3f(0.6, 1.0, 0.4)
-        glBegin(GL_QUADS)
-        glNormal3f(0.0, -1.0, 0.0)
-        glVertex3f(h, -h, h)
-        glVertex3f(-h, -h, h)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(h, -h, -h)
-        glEnd()
+    def coloredCube(self):
+        mesh = self.staticMesh('coloredCube', meshes.cube, self.cube_size, COLORED_CUBE_COLORS)
+        return mesh, self.materials['lit']
 
     def gradientCube(self):
-        glDisable(GL_LIGHTING)
-        
-        h = 1.0
-        
-        glBegin(GL_QUADS)
-        glColor3f(1.0, 0.0, 0.0)
-        glVertex3f(h, h, h)
-        glVertex3f(-h, h, h)
-        glColor3f(1.0, 1.0, 0.0)
-        glVertex3f(-h, -h, h)
-        glVertex3f(h, -h, h)
-        glEnd()
-
-        glBegin(GL_QUADS)
-        glColor3f(1.0, 0.0, 0.0)
-        glVertex3f(h, h, -h)
-        glVertex3f(h, h, h)
-        glColor3f(1.0, 1.0, 0.0)
-        glVertex3f(h, -h, h)
-        glVertex3f(h, -h, -h)
-        glEnd()
-        
-        glBegin(GL_QUADS)
-        glColor3f(1.0, 0.0, 0.0)
-        glVertex3f(-h, h, -h)
-        glVertex3f(h, h, -h)
-        glColor3f(1.0, 1.0, 0.0)
-        glVertex3f(h, -h, -h)
-        glVertex3f(-h, -h, -h)
-        glEnd()
+        mesh = self.staticMesh('gradientCube', meshes.gradient_cube, self.cube_size,
+                               (1.0, 0.0, 0.0), (1.0, 1.0, 0.0))
+        return mesh, self.materials['unlit']
 
-        glBegin(GL_QUADS)
-        glColor3f(1.0, 0.0, 0.0)
-        glVertex3f(-h, h, h)
-        glVertex3f(-h, h, -h)
-        glColor3f(1.0, 1.0, 0.0)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(-h, -h, h)
-        glEnd()
-        
-        glColor3f(1.0, 0.0, 0.0)
-        glBegin(GL_QUADS)
-        glVertex3f(h, h, h)
-        glVertex3f(h, h, -h)
-        glVertex3f(-h, h, -h)
-        glVertex3f(-h, h, h)
-        glEnd()
-        
-        glColor3f(1.0, 1.0, 0.0)
-        glBegin(GL_QUADS)
-        glVertex3f(h, -h, h)
-        glVertex3f(-h, -h, h)
-        glVertex3f(-h, -h, -h)
-        glVertex3f(h, -h, -h)
-        glEnd()
+    def animatedMesh(self, name, mesh):
+        material = self.materials[name]
+        material.uniforms['angle'] = self.angle
+        return mesh, material
 
     def dynamicCube(self):
-        glDisable(GL_LIGHTING)
+        if self.use_shaders:
+            return self.animatedMesh('dynamicCube', self.staticMesh('dynamicCube', meshes.cube, self.cube_size))
         
+        return Callback(self.drawDynamicCube, ((0.0, 0.0, 0.0), math.sqrt(3.0))), self.materials['unlit']
+    
+    def dynamicCubeColors(self):
+        a = self.angle * math.pi / 180
+        top = (abs(math.sin(2 * a)), abs(math.sin(3 * a)), abs(math.sin(5 * a)))
+        bottom = (abs(math.sin(7 * a)), abs(math.sin(11 * a)), abs(math.sin(13 * a)))
+        return top, bottom
+    
+    def drawDynamicCube(self):
         h = 1.0
         
-        red_top = abs(math.sin(2 * self.angle * math.pi / 180))
-        green_top = abs(math.sin(3 * self.angle * math.pi / 180))
-        blue_top = abs(math.sin(5 * self.angle * math.pi / 180))
-        
-        red_bottom = abs(math.sin(7 * self.angle * math.pi / 180))
-        green_bottom = abs(math.sin(11 * self.angle * math.pi / 180))
-        blue_bottom = abs(math.sin(13 * self.angle * math.pi / 180))
+        (red_top, green_top, blue_top), (red_bottom, green_bottom, blue_bottom) = self.dynamicCubeColors()
         
         glBegin(GL_QUADS)
         glColor3f(red_top, green_top, blue_top)
@@ -234,71 +248,98 @@ class OpenGLWidget(QOpenGLWidget):
         glEnd()
     
     def cylinder(self):
-        glEnable(GL_LIGHTING)
-        glEnable(GL_LIGHT0)
-        glEnable(GL_COLOR_MATERIAL)
+        if self.lod:
+            mesh = self.lodMesh('cylinderLod', meshes.cylinder, 0.5, 1.0, 0.5)
+        else:
+            mesh = self.staticMesh('cylinder', meshes.cylinder, self.cylinder_segments, 1.0, 0.5)
+        return mesh, self.materials['lit']
+    
+    def effects(self):
+        n = self.effects_segments
+        if self.use_shaders:
+            if self.lod:
+                return self.animatedMesh('effects', self.lodMesh('effectsLod', meshes.tube, 1.0, 2.0, 1.0))
+            return self.animatedMesh('effects', self.staticMesh('effects', meshes.tube, n, 2.0, 1.0))
         
-        n = 40
-        h = 1.0
-        r = 0.5
-        delta_fi = 2 * math.pi / n
-        
-        glColor3f(0.0, 1.0, 0.0)
-        glBegin(GL_QUAD_STRIP)
-        for i in range(n + 1):
-            fi = i * delta_fi
-            glNormal3f(math.cos(fi), math.sin(fi), 0.0)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), h / 2)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), -h / 2)
-        glEnd()
+        # The CPU color path recomputes colors for every vertex each frame and
+        # keeps the fixed effects_segments count.
         
-        glBegin(GL_POLYGON)
-        glColor3f(1.0, 1.0, 0.0)
-        glNormal3f(0, 0, 1)
-        for i in range(n):
-            fi = i * delta_fi
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), h / 2)
-        glEnd()
+        mesh = meshes.tube(n, 2.0, 1.0)
+        colors = self.effectsColors(n)
         
-        glBegin(GL_POLYGON)
-        glColor3f(1.0, 0.5, 0.0)
-        glNormal3f(0, 0, -1)
-        for i in range(n - 1, -1, -1):
-            fi = i * delta_fi
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), -h / 2)
-        glEnd()
+        return Callback(lambda: draw_mesh(mesh, colors=colors), mesh.bounding_sphere()), self.materials['unlit']
     
-    def effects(self):
-        glDisable(GL_LIGHTING)
-        
-        n = 80
-        h = 2.0
-        r = 1.0
-        delta_fi = 2 * math.pi / n
-        
-        glBegin(GL_QUAD_STRIP)
-        for i in range(n + 1):
-            fi = i * delta_fi
-            
-            red = abs(math.sin(2 * self.angle * math.pi / 180 - fi))
-            blue = abs(math.sin(3 * self.angle * math.pi / 180 - fi))
-            glColor3f(red, 0.0, blue)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), -h / 2)
-            
-            red = abs(math.sin(5 * self.angle * math.pi / 180 + fi))
-            blue = abs(math.sin(7 * self.angle * math.pi / 180 + fi))
-            glColor3f(red, 1.0, blue)
-            glVertex3f(r * math.cos(fi), r * math.sin(fi), h / 2)
-        glEnd()
+    def effectsColors(self, n):
+        fi = np.arange(n + 1) * (2 * math.pi / n)
+        a = self.angle * math.pi / 180
+        
+        colors = np.empty((n + 1, 2, 3), dtype=np.float32)
+        colors[:, 0, 0] = np.abs(np.sin(2 * a - fi))
+        colors[:, 0, 1] = 0.0
+        colors[:, 0, 2] = np.abs(np.sin(3 * a - fi))
+        colors[:, 1, 0] = np.abs(np.sin(5 * a + fi))
+        colors[:, 1, 1] = 1.0
+        colors[:, 1, 2] = np.abs(np.sin(7 * a + fi))
+        return colors
+    
+    def render_software(self, raster):
+        raster.clear((0.1, 0.0, 0.2))
+        projection = self.projectionMatrix(raster.width, raster.height)
+        view = self.viewMatrix()
+        pixels_per_unit = matrices.pixels_per_unit(view, projection, raster.height)
+        
+        colors = None
+        lighting = False
+        if self.task == 1:
+            mesh = meshes.cube(self.cube_size, COLORED_CUBE_COLORS)
+            lighting = True
+        elif self.task == 2:
+            mesh = meshes.gradient_cube(self.cube_size, (1.0, 0.0, 0.0), (1.0, 1.0, 0.0))
+        elif self.task == 3:
+            mesh = meshes.cube(self.cube_size)
+            top, bottom = self.dynamicCubeColors()
+            colors = np.where(mesh.positions[:, 1:2] > 0, top, bottom)
+        elif self.task == 4:
+            n = select_segments(pixels_per_unit, 0.5) if self.lod else self.cylinder_segments
+            mesh = meshes.cylinder(n, 1.0, 0.5)
+            lighting = True
+        elif self.task == 5:
+            n = select_segments(pixels_per_unit, 1.0) if self.lod else self.effects_segments
+            mesh = meshes.tube(n, 2.0, 1.0)
+            colors = self.effectsColors(n).reshape(-1, 3)
+        else:
+            return
+        raster.draw_mesh(mesh, view, projection, lighting, colors)
     
     def setTask(self, task):
         self.task = task
         self.update()
     
+    def setCylinderSegments(self, n):
+        self.cylinder_segments = n
+        self.lod = False
+        self.update()
+    
+    def setLod(self, enabled):
+        self.lod = enabled
+        self.update()
+    
+    def frame_label(self):
+        label = 'task%d' % self.task
+        if self.task == 4:
+            name, segments = 'cylinderLod', self.cylinder_segments
+        elif self.task == 5:
+            # The CPU color path never uses the LOD levels.
+            name, segments = 'effectsLod' if self.use_shaders else None, self.effects_segments
+        else:
+            return label
+        entry = self.geometry.get(name) if self.lod else None
+        if entry is None:
+            return label + '/n%d' % segments
+        return label + '/n%d/lod%d' % (entry[1].segments, entry[1].index)
+    
     def updateRotation(self):
-        self.angle += 1.0
-        if self.angle >= 360.0:
-            self.angle = 0.0
+        self.angle = self.scheduler.angle()
         self.update()
 
 
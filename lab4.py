@@ -1,13 +1,65 @@
+import os
 import sys
 import numpy as np
 import math
+from concurrent.futures import ThreadPoolExecutor
 from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel
 from PyQt6.QtOpenGLWidgets import QOpenGLWidget
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QSurfaceFormat
 from OpenGL.GL import *
+from OpenGL.error import GLError, NullFunctionError
 from PIL import Image
+from textures import checkerboard_array, spiral_array
+from bmp import UnsupportedBmp, read_bmp
+from texture_cache import default_cache
+from texture_manager import TextureManager, content_key
+from frame_stats import FrameStatsMixin, enable_from_environment
+import capture
+from atlas import build_atlas, load_media
+import matrices
+from scene import Callback, Material, Node, Scene
+from gl_state import GLState
+from gl_mesh import VertexArray
+from shaders import ShaderProgram
 
-class GLWidget(QOpenGLWidget):
+TEXTURED_VERTEX = """
+#version 330 core
+uniform mat4 modelViewProjection;
+uniform mat4 textureMatrix;
+in vec3 position;
+in vec2 texcoord;
+out vec2 uv;
+void main() {
+    uv = (textureMatrix * vec4(texcoord, 0.0, 1.0)).xy;
+    gl_Position = modelViewProjection * vec4(position, 1.0);
+}
+"""
+
+TEXTURED_FRAGMENT = """
+#version 330 core
+uniform sampler2D image;
+in vec2 uv;
+out vec4 color;
+void main() {
+    color = vec4(texture(image, uv).rgb, 1.0);
+}
+"""
+
+CUBE_FACES = [
+    [((1, 1), ( 1,  1,  1)), ((0, 1), (-1,  1,  1)), ((0, 0), (-1, -1,  1)), ((1, 0), ( 1, -1,  1))],
+    [((1, 1), ( 1,  1, -1)), ((0, 1), ( 1,  1,  1)), ((0, 0), ( 1, -1,  1)), ((1, 0), ( 1, -1, -1))],
+    [((1, 1), (-1,  1, -1)), ((0, 1), ( 1,  1, -1)), ((0, 0), ( 1, -1, -1)), ((1, 0), (-1, -1, -1))],
+    [((1, 1), (-1,  1,  1)), ((0, 1), (-1,  1, -1)), ((0, 0), (-1, -1, -1)), ((1, 0), (-1, -1,  1))],
+    [((1, 1), (-1,  1,  1)), ((0, 1), ( 1,  1,  1)), ((0, 0), ( 1,  1, -1)), ((1, 0), (-1,  1, -1))],
+    [((1, 1), ( 1, -1,  1)), ((0, 1), (-1, -1,  1)), ((0, 0), (-1, -1, -1)), ((1, 0), ( 1, -1, -1))],
+]
+CUBE_TRIANGLES = np.array([[4 * face + i for i in (0, 1, 2, 0, 2, 3)] for face in range(len(CUBE_FACES))],
+                          dtype=np.uint32).reshape(-1, 3)
+
+class GLWidget(FrameStatsMixin, QOpenGLWidget):
+    texture_loaded = pyqtSignal(int, object)
+    
     def __init__(self):
         super().__init__()
         self.angle_x = 20.0
@@ -19,15 +71,48 @@ class GLWidget(QOpenGLWidget):
         self.mult = 1.0
         self.texture_ready = False
         self.texture_id = None
+        self.texture_cache = default_cache()
+        self.texture_source = 'checkerboard'
+        self.gl_state = GLState()
+        self.textures = TextureManager(cache=self.texture_cache, state=self.gl_state)
+        self.atlas = None
+        self.face_textures = None
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.load_future = None
+        self.load_generation = 0
+        self.pending_texture = None
+        self.texture_loaded.connect(self.texture_finished)
+        self.projection = matrices.perspective(45.0, 1.0, 0.1, 50.0)
+        self.use_shaders = True
+        self.program = None
+        self.cube_array = None
+        self.material = Material('textured')
+        self.scene = Scene(self.gl_state)
+        cube = Callback(self.draw_textured_cube, ((0.0, 0.0, 0.0), math.sqrt(3.0)))
+        self.cube = self.scene.add(Node('cube', cube, self.material))
+        
+        enable_from_environment(self)
+        capture.enable_from_environment(self)
         
     def initializeGL(self):
+        # initializeGL also runs for a re-created context, e.g. after
+        # reparenting; nothing uploaded to the previous one is still valid.
+        self.gl_state.invalidate()
+        self.textures.forget_all()
+        self.texture_id = None
         glClearColor(0.2, 0.2, 0.2, 1.0)
-        glEnable(GL_DEPTH_TEST)
+        self.gl_state.enable(GL_DEPTH_TEST)
+        
+        if self.use_shaders:
+            try:
+                self.program = ShaderProgram(TEXTURED_VERTEX, TEXTURED_FRAGMENT, {0: 'position', 1: 'texcoord'})
+                self.cube_array = VertexArray(self.cube_vertex_data(), CUBE_TRIANGLES, ((0, 3), (1, 2)))
+            except (RuntimeError, GLError, NullFunctionError) as e:
+                print(f"Shader path unavailable, using fixed-function texturing: {e}")
+                self.program = None
+                self.cube_array = None
         
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
         self.set_perspective()
-        glMatrixMode(GL_MODELVIEW)
         
         self.calculate_checkerboard_texture()
         self.setup_texture()
@@ -39,37 +124,44 @@ class GLWidget(QOpenGLWidget):
         
         if h == 0:
             h = 1
-        aspect = w / h
-        fov = 45.0 * math.pi / 180.0
-        f = 1.0 / math.tan(fov / 2.0)
-        znear = 0.1
-        zfar = 50.0
+        self.projection = self.projection_matrix(w, h)
+        if self.program is not None:
+            return
         
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        matrix = [
-            f / aspect, 0, 0, 0,
-            0, f, 0, 0,
-            0, 0, (zfar + znear) / (znear - zfar), -1,
-            0, 0, (2 * zfar * znear) / (znear - zfar), 0
-        ]
-        glMultMatrixf(matrix)
+        glLoadMatrixf(self.projection.T)
         glMatrixMode(GL_MODELVIEW)
         
+    def projection_matrix(self, w, h):
+        return matrices.perspective(45.0, w / h, 0.1, 50.0)
+        
+    def view_matrix(self):
+        return (matrices.translate(0, 0, -5) @ matrices.rotate(self.angle_x, 1, 0, 0) @
+                matrices.rotate(self.angle_y, 0, 1, 0))
+        
     def resizeGL(self, w, h):
         glViewport(0, 0, w, h)
         self.set_perspective()
         
     def paintGL(self):
+        if self.pending_texture is not None:
+            self.apply_pending_texture()
+        
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        glLoadIdentity()
         
-        glTranslatef(0, 0, -5)
-        glRotatef(self.angle_x, 1, 0, 0)
-        glRotatef(self.angle_y, 0, 1, 0)
+        view = self.view_matrix()
+        self.cube.visible = self.texture_ready
+        if self.program is not None:
+            # Core profile: nothing goes through the fixed-function matrix
+            # stacks; the scene only culls, and each visible cube is one
+            # draw from its VAO with NumPy-computed uniforms.
+            for node, world in self.scene.cull(view, self.projection):
+                self.draw_cube_array(self.projection @ view @ world)
+            return
         
-        if self.texture_ready:
-            self.draw_textured_cube()
+        glLoadMatrixf(view.T)
+        self.material.texture = self.texture_id
+        self.scene.draw(view, self.projection)
         
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
@@ -88,113 +180,217 @@ class GLWidget(QOpenGLWidget):
         self.last_pos = None
         
     def load_bmp_texture(self, filename):
+        img_data = self.read_texture_file(filename)
+        if img_data is None:
+            return False
+        self.arrayRGB = img_data
+        return True
+        
+    def read_texture_file(self, filename):
+        try:
+            img_data = read_bmp(filename)
+            if img_data.shape[:2] == (self.TH, self.TW):
+                return img_data
+        except (OSError, UnsupportedBmp):
+            pass
+        
         try:
             img = Image.open(filename)
             img = img.resize((self.TW, self.TH))
             img = img.convert('RGB')
             
             img_data = np.array(img, dtype=np.uint8)
-            self.arrayRGB = np.flipud(img_data)
-            
-            return True
+            return np.flipud(img_data)
         except Exception as e:
             print(f"Error loading texture: {e}")
-            return False
+            return None
             
+    def set_texture_size(self, tw, th):
+        self.TW = tw
+        self.TH = th
+        self.ensure_texture_buffer()
+        
+    def ensure_texture_buffer(self):
+        shape = (self.TH, self.TW, 3)
+        if self.arrayRGB.shape != shape or not self.arrayRGB.flags.writeable:
+            self.arrayRGB = np.zeros(shape, dtype=np.uint8)
+        
     def calculate_checkerboard_texture(self):
-        light_color = np.array([210, 180, 140], dtype=np.uint8)
-        dark_color = np.array([101, 67, 33], dtype=np.uint8)
+        if self.texture_cache is not None:
+            self.arrayRGB = self.generated_texture('lab4.checkerboard', checkerboard_array)
+            return
         
-        for i in range(self.TW):
-            for j in range(self.TH):
-                if (i < self.TW // 2 and j < self.TH // 2) or (i >= self.TW // 2 and j >= self.TH // 2):
-                    self.arrayRGB[j, i] = dark_color
-                else:
-                    self.arrayRGB[j, i] = light_color
+        self.ensure_texture_buffer()
+        checkerboard_array(self.TW, self.TH, out=self.arrayRGB)
         
     def calculate_pattern_texture(self):
-        for i in range(self.TW):
-            for j in range(self.TH):
-                x = (i - self.TW // 2) / self.TW * 8
-                y = (j - self.TH // 2) / self.TH * 8
-                r = math.sqrt(x * x + y * y)
-                fi = math.atan(y / x) if x != 0.0 else math.pi / 2
-                value = abs(math.cos(8 * fi - r))
-                
-                if (value % 1.0) < 0.75:
-                    self.arrayRGB[j, i] = [255, 255, 0]
-                else:
-                    self.arrayRGB[j, i] = [0, 0, 255]
-        
-    def setup_texture(self):
-        glEnable(GL_TEXTURE_2D)
-        
-        if self.texture_id is not None:
-            glDeleteTextures([self.texture_id])
-        
-        self.texture_id = glGenTextures(1)
-        glBindTexture(GL_TEXTURE_2D, self.texture_id)
-        
-        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGB, self.TW, self.TH, 0, GL_RGB, GL_UNSIGNED_BYTE, self.arrayRGB)
-        
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        
-        glTexEnvi(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
-        glDisable(GL_TEXTURE_2D)
+        if self.texture_cache is not None:
+            self.arrayRGB = self.generated_texture('lab4.pattern', spiral_array)
+            return
+        
+        self.ensure_texture_buffer()
+        spiral_array(self.TW, self.TH, out=self.arrayRGB)
+        
+    def build_texture_atlas(self, media='media'):
+        self.atlas = self.texture_atlas(media)
+        if self.face_textures is None:
+            self.face_textures = sorted(self.atlas.rects)
+        self.arrayRGB = self.atlas.image
+        
+    def texture_atlas(self, media='media'):
+        images = load_media(media)
+        if self.texture_cache is not None:
+            images['checkerboard'] = self.texture_cache.get_or_create(
+                'lab4.checkerboard', checkerboard_array, width=self.TW, height=self.TH)
+            images['pattern'] = self.texture_cache.get_or_create(
+                'lab4.pattern', spiral_array, width=self.TW, height=self.TH)
+        else:
+            images['checkerboard'] = checkerboard_array(self.TW, self.TH)
+            images['pattern'] = spiral_array(self.TW, self.TH)
+        return build_atlas(images)
+        
+    def request_texture(self, source):
+        # Generation and file I/O run on the loader thread; the current texture
+        # stays bound until the result reaches paintGL. Only the newest
+        # request counts: older ones are cancelled if they have not started
+        # yet and dropped on arrival otherwise.
+        self.load_generation += 1
+        if self.load_future is not None:
+            self.load_future.cancel()
+        self.load_future = self.loader.submit(self.produce_texture, self.load_generation, source)
+        self.load_future.add_done_callback(self.texture_failed)
+        
+    def produce_texture(self, generation, source):
+        if generation != self.load_generation:
+            return
+        atlas = None
+        if source == 'file':
+            array = self.read_texture_file('media/texture.bmp')
+        elif source == 'checkerboard':
+            array = self.generated_texture('lab4.checkerboard', checkerboard_array)
+        elif source == 'pattern':
+            array = self.generated_texture('lab4.pattern', spiral_array)
+        elif source == 'atlas':
+            atlas = self.texture_atlas()
+            array = atlas.image
+        else:
+            raise ValueError('Unknown texture source: %s' % source)
+        if array is None or generation != self.load_generation:
+            return
+        key = content_key(array)
+        mip_levels = self.textures.mip_levels(array, key, atlas.max_level if atlas is not None else None)
+        self.texture_loaded.emit(generation, (source, array, key, mip_levels, atlas))
+        
+    def texture_failed(self, future):
+        # Runs on the loader thread; nothing else collects the future's result.
+        if future.cancelled() or future.exception() is None:
+            return
+        print(f"Error loading texture: {future.exception()}")
+        
+    def generated_texture(self, name, func):
+        if self.texture_cache is not None:
+            return self.texture_cache.get_or_create(name, func, width=self.TW, height=self.TH)
+        return func(self.TW, self.TH)
+        
+    def texture_finished(self, generation, result):
+        if generation != self.load_generation:
+            return
+        self.pending_texture = result
+        self.update()
         
-    def draw_textured_cube(self):
-        h = 1.0
+    def apply_pending_texture(self):
+        source, array, key, mip_levels, atlas = self.pending_texture
+        self.pending_texture = None
+        if atlas is not None:
+            self.atlas = atlas
+            if self.face_textures is None:
+                self.face_textures = sorted(atlas.rects)
+        self.arrayRGB = array
+        self.texture_source = source
+        self.setup_texture(key, mip_levels)
         
-        glEnable(GL_TEXTURE_2D)
-        glBindTexture(GL_TEXTURE_2D, self.texture_id)
+    def shutdown_loader(self):
+        self.load_generation += 1
+        self.loader.shutdown(wait=False, cancel_futures=True)
         
-        glMatrixMode(GL_TEXTURE)
-        glLoadIdentity()
-        glScalef(self.mult, self.mult, self.mult)
-        glMatrixMode(GL_MODELVIEW)
+    def setup_texture(self, key=None, mip_levels=None):
+        max_level = self.atlas.max_level if self.atlas_mode() else None
+        if self.program is not None:
+            self.texture_id = self.textures.upload(self.texture_source, self.arrayRGB, key, mip_levels, max_level)
+            return
         
-        glBegin(GL_QUADS)
+        self.gl_state.enable(GL_TEXTURE_2D)
         
-        glTexCoord2f(1, 1); glVertex3f( h,  h,  h)
-        glTexCoord2f(0, 1); glVertex3f(-h,  h,  h)
-        glTexCoord2f(0, 0); glVertex3f(-h, -h,  h)
-        glTexCoord2f(1, 0); glVertex3f( h, -h,  h)
+        self.texture_id = self.textures.upload(self.texture_source, self.arrayRGB, key, mip_levels, max_level)
         
-        glTexCoord2f(1, 1); glVertex3f( h,  h, -h)
-        glTexCoord2f(0, 1); glVertex3f( h,  h,  h)
-        glTexCoord2f(0, 0); glVertex3f( h, -h,  h)
-        glTexCoord2f(1, 0); glVertex3f( h, -h, -h)
+        self.gl_state.tex_env(GL_TEXTURE_ENV, GL_TEXTURE_ENV_MODE, GL_DECAL)
+        self.gl_state.disable(GL_TEXTURE_2D)
         
-        glTexCoord2f(1, 1); glVertex3f(-h,  h, -h)
-        glTexCoord2f(0, 1); glVertex3f( h,  h, -h)
-        glTexCoord2f(0, 0); glVertex3f( h, -h, -h)
-        glTexCoord2f(1, 0); glVertex3f(-h, -h, -h)
+    def draw_textured_cube(self):
+        state = self.gl_state
+        state.enable(GL_TEXTURE_2D)
+        state.bind_texture(GL_TEXTURE_2D, self.texture_id)
         
-        glTexCoord2f(1, 1); glVertex3f(-h,  h,  h)
-        glTexCoord2f(0, 1); glVertex3f(-h,  h, -h)
-        glTexCoord2f(0, 0); glVertex3f(-h, -h, -h)
-        glTexCoord2f(1, 0); glVertex3f(-h, -h,  h)
+        # The texture matrix is left holding the scale between frames; the
+        # state tracker knows its value, so it is only reloaded on a change.
+        state.texture_scale(self.texture_matrix_scale())
         
-        glTexCoord2f(1, 1); glVertex3f(-h,  h,  h)
-        glTexCoord2f(0, 1); glVertex3f( h,  h,  h)
-        glTexCoord2f(0, 0); glVertex3f( h,  h, -h)
-        glTexCoord2f(1, 0); glVertex3f(-h,  h, -h)
+        glBegin(GL_QUADS)
         
-        glTexCoord2f(1, 1); glVertex3f( h, -h,  h)
-        glTexCoord2f(0, 1); glVertex3f(-h, -h,  h)
-        glTexCoord2f(0, 0); glVertex3f(-h, -h, -h)
-        glTexCoord2f(1, 0); glVertex3f( h, -h, -h)
+        for (s, t), vertex in self.cube_vertices():
+            glTexCoord2f(s, t)
+            glVertex3f(*vertex)
         
         glEnd()
         
-        glDisable(GL_TEXTURE_2D)
-        
-        glMatrixMode(GL_TEXTURE)
-        glLoadIdentity()
-        glMatrixMode(GL_MODELVIEW)
+        state.disable(GL_TEXTURE_2D)
+        
+    def draw_cube_array(self, model_view_projection):
+        # The program, VAO and texture stay bound between frames; the state
+        # tracker and the program's uniform cache skip everything unchanged,
+        # so a still frame is a clear and one glDrawElements.
+        state = self.gl_state
+        self.cube_array.update(self.cube_vertex_data())
+        state.use_program(self.program.program)
+        self.program.set_matrix('modelViewProjection', model_view_projection)
+        self.program.set_matrix('textureMatrix', matrices.scale(self.texture_matrix_scale()))
+        state.bind_texture(GL_TEXTURE_2D, self.texture_id)
+        state.bind_vertex_array(self.cube_array.vao)
+        self.cube_array.draw_elements()
+        
+    def cube_vertex_data(self):
+        return np.array([vertex + uv for uv, vertex in self.cube_vertices()], dtype=np.float32)
+        
+    def atlas_mode(self):
+        return self.atlas is not None and self.texture_source == 'atlas'
+        
+    def texture_matrix_scale(self):
+        return 1.0 if self.atlas_mode() else self.mult
+        
+    def cube_vertices(self):
+        # Atlas tiles cannot GL_REPEAT on their own, so in atlas mode the scale
+        # is applied to the per-tile coordinates and clamped to one repeat.
+        if not self.atlas_mode():
+            return [corner for corners in CUBE_FACES for corner in corners]
+        scale = min(self.mult, 1.0)
+        vertices = []
+        for face, corners in enumerate(CUBE_FACES):
+            name = self.face_textures[face % len(self.face_textures)]
+            for (s, t), vertex in corners:
+                vertices.append((self.atlas.remap(name, s * scale, t * scale), vertex))
+        return vertices
+        
+    def render_software(self, raster):
+        raster.clear((0.2, 0.2, 0.2))
+        vertices = self.cube_vertices()
+        uvs = np.array([uv for uv, _ in vertices], dtype=np.float32)
+        positions = np.array([vertex for _, vertex in vertices], dtype=np.float32)
+        raster.draw(positions, CUBE_TRIANGLES, self.view_matrix(),
+                    self.projection_matrix(raster.width, raster.height),
+                    uvs=uvs, texture=self.arrayRGB, texture_scale=self.texture_matrix_scale())
+        
+    def frame_label(self):
+        return '%s/x%.2f' % (self.texture_source, self.mult)
         
     def change_scale(self, delta):
         self.mult += delta
@@ -239,6 +435,10 @@ class MainWindow(QMainWindow):
         btn3.clicked.connect(self.load_pattern)
         controls_layout.addWidget(btn3)
         
+        btn4 = QPushButton("Атлас")
+        btn4.clicked.connect(self.load_atlas)
+        controls_layout.addWidget(btn4)
+        
         controls_layout.addStretch()
         
         btn_minus = QPushButton("Масштаб -")
@@ -256,21 +456,28 @@ class MainWindow(QMainWindow):
         layout.addLayout(controls_layout)
         
     def load_texture(self):
-        if self.gl_widget.load_bmp_texture('media/texture.bmp'):
-            self.gl_widget.setup_texture()
-            self.gl_widget.update()
+        self.gl_widget.request_texture('file')
         
     def load_checkerboard(self):
-        self.gl_widget.calculate_checkerboard_texture()
-        self.gl_widget.setup_texture()
-        self.gl_widget.update()
+        self.gl_widget.request_texture('checkerboard')
         
     def load_pattern(self):
-        self.gl_widget.calculate_pattern_texture()
-        self.gl_widget.setup_texture()
-        self.gl_widget.update()
+        self.gl_widget.request_texture('pattern')
+        
+    def load_atlas(self):
+        self.gl_widget.request_texture('atlas')
+        
+    def closeEvent(self, event):
+        self.gl_widget.shutdown_loader()
+        super().closeEvent(event)
 
 def main():
+    if os.environ.get('LAB4_CORE_PROFILE'):
+        surface_format = QSurfaceFormat()
+        surface_format.setVersion(3, 3)
+        surface_format.setProfile(QSurfaceFormat.OpenGLContextProfile.CoreProfile)
+        surface_format.setDepthBufferSize(24)
+        QSurfaceFormat.setDefaultFormat(surface_format)
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
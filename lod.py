@@ -0,0 +1,59 @@
+import math
+
+from gl_mesh import MeshBuffer
+
+LOD_LEVELS = (6, 8, 12, 16, 24, 32, 48, 64, 96, 128, 192, 256)
+LOD_ERROR = 0.5
+
+
+def chord_error(segments):
+    # Largest gap between a unit circle and its inscribed n-gon (the sagitta).
+    return 1.0 - math.cos(math.pi / segments)
+
+
+def select_index(radius_px, errors, error=LOD_ERROR):
+    for index, level_error in enumerate(errors):
+        if radius_px * level_error <= error:
+            return index
+    return len(errors) - 1
+
+
+def select_segments(pixels_per_unit, radius, levels=LOD_LEVELS, error=LOD_ERROR):
+    return levels[select_index(radius * pixels_per_unit, [chord_error(n) for n in levels], error)]
+
+
+class LodMesh:
+    # Every tessellation level is uploaded once up front; select() only moves
+    # an index, so switching levels costs no allocation and no upload.
+    def __init__(self, builder, radius, *params, levels=LOD_LEVELS, error=LOD_ERROR):
+        self.radius = radius
+        self.error = error
+        self.levels = tuple(levels)
+        self.errors = tuple(chord_error(n) for n in self.levels)
+        self.buffers = [MeshBuffer(builder(n, *params)) for n in self.levels]
+        self.bounds = max((buffer.bounds for buffer in self.buffers), key=lambda bounds: bounds[1])
+        self.index = len(self.levels) - 1
+
+    @property
+    def segments(self):
+        return self.levels[self.index]
+
+    @property
+    def current(self):
+        return self.buffers[self.index]
+
+    @property
+    def vertex_count(self):
+        return self.current.vertex_count
+
+    def select(self, pixels_per_unit):
+        self.index = select_index(self.radius * pixels_per_unit, self.errors, self.error)
+        return self.levels[self.index]
+
+    def draw(self, mode='fill'):
+        self.current.draw(mode)
+
+    def delete(self):
+        for buffer in self.buffers:
+            buffer.delete()
+        self.buffers = []
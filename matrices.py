@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+# Row-major 4x4 matrices acting on column vectors, the same layout as the
+# glOrtho/glRotatef documentation. Pass matrix.T to glLoadMatrixf/glMultMatrixf.
+
+
+def identity():
+    return np.eye(4, dtype=np.float32)
+
+
+def translate(x, y, z):
+    m = identity()
+    m[:3, 3] = (x, y, z)
+    return m
+
+
+def scale(x, y=None, z=None):
+    y = x if y is None else y
+    z = x if z is None else z
+    return np.diag(np.array((x, y, z, 1.0), dtype=np.float32))
+
+
+def rotate(angle, x, y, z):
+    axis = np.array((x, y, z), dtype=np.float64)
+    x, y, z = axis / np.linalg.norm(axis)
+    a = math.radians(angle)
+    c = math.cos(a)
+    s = math.sin(a)
+    t = 1.0 - c
+    m = identity()
+    m[:3, :3] = (
+        (t * x * x + c, t * x * y - s * z, t * x * z + s * y),
+        (t * x * y + s * z, t * y * y + c, t * y * z - s * x),
+        (t * x * z - s * y, t * y * z + s * x, t * z * z + c),
+    )
+    return m
+
+
+def ortho(left, right, bottom, top, near, far):
+    m = identity()
+    m[0, 0] = 2.0 / (right - left)
+    m[1, 1] = 2.0 / (top - bottom)
+    m[2, 2] = -2.0 / (far - near)
+    m[:3, 3] = (-(right + left) / (right - left),
+                -(top + bottom) / (top - bottom),
+                -(far + near) / (far - near))
+    return m
+
+
+def perspective(fov, aspect, near, far):
+    f = 1.0 / math.tan(math.radians(fov) / 2.0)
+    m = np.zeros((4, 4), dtype=np.float32)
+    m[0, 0] = f / aspect
+    m[1, 1] = f
+    m[2, 2] = (far + near) / (near - far)
+    m[2, 3] = 2.0 * far * near / (near - far)
+    m[3, 2] = -1.0
+    return m
+
+
+def pixels_per_unit(modelview, projection, viewport_height, point=(0.0, 0.0, 0.0)):
+    # Screen pixels covered by one model unit at `point`, using the largest
+    # axis scale of the modelview. Orthographic projections have no depth
+    # divide; perspective ones shrink with the eye-space distance.
+    m = np.asarray(modelview, dtype=np.float64)
+    size = np.linalg.norm(m[:3, :3], axis=0).max() * projection[1, 1] * viewport_height / 2.0
+    if projection[3, 3] == 1.0:
+        return size
+    depth = -(m[2, :3] @ np.asarray(point, dtype=np.float64) + m[2, 3])
+    return size / max(depth, 1e-6)
+
+
+def frustum_planes(matrix):
+    # Gribb/Hartmann: the six clip planes of a view-projection matrix as
+    # normalized (a, b, c, d) rows, with the normals pointing inwards.
+    m = np.asarray(matrix, dtype=np.float64)
+    planes = np.array([
+        m[3] + m[0], m[3] - m[0],
+        m[3] + m[1], m[3] - m[1],
+        m[3] + m[2], m[3] - m[2],
+    ])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def spheres_visible(planes, centers, radii):
+    distances = np.asarray(centers) @ planes[:, :3].T + planes[:, 3]
+    return np.all(distances >= -np.asarray(radii)[:, np.newaxis], axis=1)
@@ -0,0 +1,193 @@
+from functools import lru_cache
+
+import numpy as np
+
+MESH_CACHE_SIZE = 64
+
+
+class Mesh:
+    def __init__(self, positions, normals, colors, triangles, edges):
+        self.positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        self.normals = np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        self.colors = np.asarray(colors, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.uint32).reshape(-1, 3)
+        self.edges = np.asarray(edges, dtype=np.uint32).reshape(-1, 2)
+
+    @property
+    def vertex_count(self):
+        return len(self.positions)
+
+    def freeze(self):
+        for array in (self.positions, self.normals, self.colors, self.triangles, self.edges):
+            array.flags.writeable = False
+        return self
+
+    def bounding_sphere(self):
+        low = self.positions.min(axis=0)
+        high = self.positions.max(axis=0)
+        center = (low + high) / 2
+        return center, float(np.linalg.norm(self.positions - center, axis=1).max())
+
+    def interleaved(self):
+        return np.ascontiguousarray(np.hstack([self.positions, self.normals, self.colors]))
+
+
+def merge(*meshes):
+    offsets = np.cumsum([0] + [m.vertex_count for m in meshes[:-1]])
+    return Mesh(
+        np.vstack([m.positions for m in meshes]),
+        np.vstack([m.normals for m in meshes]),
+        np.vstack([m.colors for m in meshes]),
+        np.vstack([m.triangles + o for m, o in zip(meshes, offsets)]),
+        np.vstack([m.edges + o for m, o in zip(meshes, offsets)]),
+    )
+
+
+def quads(corners, normals, colors):
+    corners = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 3)
+    count = len(corners)
+    base = np.arange(count)[:, np.newaxis] * 4
+    triangles = np.concatenate([base + [0, 1, 2], base + [0, 2, 3]], axis=1).reshape(-1, 3)
+    edges = (base + [0, 1, 1, 2, 2, 3, 3, 0]).reshape(-1, 2)
+    return Mesh(
+        corners,
+        np.repeat(np.asarray(normals, dtype=np.float64).reshape(-1, 3), 4, axis=0),
+        np.repeat(np.broadcast_to(colors, (count, 3)), 4, axis=0),
+        triangles,
+        edges,
+    )
+
+
+def polygon(points, normal, color):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    count = len(points)
+    k = np.arange(1, count - 1)
+    ring = np.arange(count)
+    return Mesh(
+        points,
+        np.broadcast_to(normal, (count, 3)),
+        np.broadcast_to(color, (count, 3)),
+        np.stack([np.zeros_like(k), k, k + 1], axis=1),
+        np.stack([ring, np.roll(ring, -1)], axis=1),
+    )
+
+
+def strip(first, second, normals, colors):
+    columns = len(first)
+    i = np.arange(columns - 1)[:, np.newaxis] * 2
+    ring_edges = np.arange(columns - 1)[:, np.newaxis] * 2 + [0, 2]
+    return Mesh(
+        np.stack([first, second], axis=1).reshape(-1, 3),
+        np.repeat(np.asarray(normals, dtype=np.float64).reshape(-1, 3), 2, axis=0),
+        np.broadcast_to(colors, (columns * 2, 3)),
+        np.concatenate([i + [0, 1, 3], i + [0, 3, 2]], axis=1).reshape(-1, 3),
+        np.vstack([
+            np.stack([np.arange(columns) * 2, np.arange(columns) * 2 + 1], axis=1),
+            ring_edges,
+            ring_edges + 1,
+        ]),
+    )
+
+
+def ring(n, r, z):
+    fi = np.arange(n) * (2 * np.pi / n)
+    return np.stack([r * np.cos(fi), r * np.sin(fi), np.full(n, z)], axis=1)
+
+
+CUBE_COLORS = (
+    (1.0, 0.0, 0.0), (0.0, 0.0, 1.0), (0.0, 1.0, 0.0),
+    (1.0, 1.0, 0.0), (1.0, 0.0, 1.0), (0.0, 1.0, 1.0),
+)
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def cube(h=1.0, colors=CUBE_COLORS):
+    corners = np.array([
+        [(h, h, h), (-h, h, h), (-h, -h, h), (h, -h, h)],
+        [(h, h, -h), (h, h, h), (h, -h, h), (h, -h, -h)],
+        [(-h, h, -h), (h, h, -h), (h, -h, -h), (-h, -h, -h)],
+        [(-h, h, h), (-h, h, -h), (-h, -h, -h), (-h, -h, h)],
+        [(h, h, h), (h, h, -h), (-h, h, -h), (-h, h, h)],
+        [(h, -h, h), (-h, -h, h), (-h, -h, -h), (h, -h, -h)],
+    ])
+    normals = [
+        (0.0, 0.0, 1.0), (1.0, 0.0, 0.0), (0.0, 0.0, -1.0),
+        (-1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, -1.0, 0.0),
+    ]
+    return quads(corners, normals, colors).freeze()
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def gradient_cube(h=1.0, top=(1.0, 0.0, 0.0), bottom=(1.0, 1.0, 0.0)):
+    mesh = cube(h)
+    colors = np.where(mesh.positions[:, 1:2] > 0, top, bottom)
+    return Mesh(mesh.positions, mesh.normals, colors, mesh.triangles, mesh.edges).freeze()
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def prism(n=16, h=1.0, r=0.5):
+    delta_fi = 2 * np.pi / n
+    top = ring(n, r, h / 2)
+    bottom = ring(n, r, -h / 2)
+    nxt = np.roll(np.arange(n), -1)
+
+    corners = np.stack([top, bottom, bottom[nxt], top[nxt]], axis=1)
+    mid = np.arange(n) * delta_fi + delta_fi / 2
+    normals = np.stack([np.cos(mid), np.sin(mid), np.zeros(n)], axis=1)
+
+    return merge(
+        quads(corners, normals, (0.0, 1.0, 0.0)),
+        polygon(top, (0.0, 0.0, 1.0), (1.0, 1.0, 0.0)),
+        polygon(bottom[::-1], (0.0, 0.0, -1.0), (1.0, 0.5, 0.0)),
+    ).freeze()
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def pyramid(n=16, h=1.0, r=0.5):
+    delta_fi = 2 * np.pi / n
+    teta = np.arctan(h / r)
+    base = ring(n, r, 0.0)
+    nxt = np.roll(np.arange(n), -1)
+    i = np.arange(n)
+
+    apex = np.broadcast_to((0.0, 0.0, h), (n, 3))
+    positions = np.stack([apex, base, base[nxt]], axis=1).reshape(-1, 3)
+    mid = i * delta_fi + delta_fi / 2
+    normals = np.stack([
+        np.cos(mid) * np.sin(teta),
+        np.sin(mid) * np.sin(teta),
+        np.full(n, np.cos(teta)),
+    ], axis=1)
+    colors = np.stack([i % 2, (i % 3) / 2, (i % 5) / 4], axis=1)
+
+    first = i[:, np.newaxis] * 3
+    sides = Mesh(
+        positions,
+        np.repeat(normals, 3, axis=0),
+        np.repeat(colors, 3, axis=0),
+        first + [0, 1, 2],
+        (first + [0, 1, 1, 2, 2, 0]).reshape(-1, 2),
+    )
+    return merge(sides, polygon(base[::-1], (0.0, 0.0, -1.0), (0.8, 0.8, 0.0))).freeze()
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def tube(n=80, h=2.0, r=1.0, color=(1.0, 1.0, 1.0)):
+    fi = np.arange(n + 1) * (2 * np.pi / n)
+    normals = np.stack([np.cos(fi), np.sin(fi), np.zeros(n + 1)], axis=1)
+    bottom = np.stack([r * np.cos(fi), r * np.sin(fi), np.full(n + 1, -h / 2)], axis=1)
+    top = np.stack([r * np.cos(fi), r * np.sin(fi), np.full(n + 1, h / 2)], axis=1)
+    return strip(bottom, top, normals, color).freeze()
+
+
+@lru_cache(maxsize=MESH_CACHE_SIZE)
+def cylinder(n=40, h=1.0, r=0.5):
+    fi = np.arange(n + 1) * (2 * np.pi / n)
+    normals = np.stack([np.cos(fi), np.sin(fi), np.zeros(n + 1)], axis=1)
+    top = np.stack([r * np.cos(fi), r * np.sin(fi), np.full(n + 1, h / 2)], axis=1)
+    bottom = np.stack([r * np.cos(fi), r * np.sin(fi), np.full(n + 1, -h / 2)], axis=1)
+    return merge(
+        strip(top, bottom, normals, (0.0, 1.0, 0.0)),
+        polygon(ring(n, r, h / 2), (0.0, 0.0, 1.0), (1.0, 1.0, 0.0)),
+        polygon(ring(n, r, -h / 2)[::-1], (0.0, 0.0, -1.0), (1.0, 0.5, 0.0)),
+    ).freeze()
@@ -0,0 +1,80 @@
+import numpy as np
+
+LANCZOS_A = 2
+
+
+def level_sizes(width, height):
+    sizes = [(width, height)]
+    while width > 1 or height > 1:
+        width = max(1, width // 2)
+        height = max(1, height // 2)
+        sizes.append((width, height))
+    return sizes
+
+
+def _box_axis(data, axis):
+    n = data.shape[axis]
+    if n == 1:
+        return data
+    even = (n // 2) * 2
+    first = np.take(data, np.arange(0, even, 2), axis=axis)
+    second = np.take(data, np.arange(1, even, 2), axis=axis)
+    return (first + second) * 0.5
+
+
+def _lanczos_weights():
+    # Output sample j sits between input samples 2j and 2j+1; with a = 2 the
+    # kernel covers six inputs, 2j-2 .. 2j+3, at half-pixel distances.
+    x = (np.arange(-2, 4) - 0.5) / 2.0
+    weights = np.sinc(x) * np.sinc(x / LANCZOS_A)
+    return weights / weights.sum()
+
+
+LANCZOS_WEIGHTS = _lanczos_weights()
+
+
+def _lanczos_axis(data, axis):
+    n = data.shape[axis]
+    if n == 1:
+        return data
+    out_n = n // 2
+    pad = [(0, 0)] * data.ndim
+    pad[axis] = (2, 3)
+    padded = np.pad(data, pad, mode='edge')
+    result = 0.0
+    for k, weight in enumerate(LANCZOS_WEIGHTS):
+        result = result + weight * np.take(padded, np.arange(out_n) * 2 + k, axis=axis)
+    return result
+
+
+def downsample(level, method='box'):
+    reduce_axis = _lanczos_axis if method == 'lanczos' else _box_axis
+    data = level.astype(np.float32)
+    data = reduce_axis(reduce_axis(data, 0), 1)
+    return np.clip(np.rint(data), 0, 255).astype(np.uint8)
+
+
+def build_mip_chain(image, method='box'):
+    levels = [image]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        levels.append(downsample(levels[-1], method))
+    return levels
+
+
+def pack_chain(image, method='box'):
+    # Levels 1..n flattened into one array, so a chain can live in a single
+    # memory-mapped cache file next to its base image.
+    levels = build_mip_chain(image, method)[1:]
+    if not levels:
+        return np.empty(0, dtype=np.uint8)
+    return np.concatenate([level.ravel() for level in levels])
+
+
+def unpack_chain(packed, width, height, channels=3):
+    levels = []
+    offset = 0
+    for w, h in level_sizes(width, height)[1:]:
+        size = w * h * channels
+        levels.append(packed[offset:offset + size].reshape(h, w, channels))
+        offset += size
+    return levels
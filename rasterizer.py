@@ -0,0 +1,327 @@
+import numpy as np
+
+TILE = 16
+TILE_BATCH = 2048
+SHADING = ('flat', 'gouraud')
+SAMPLING = ('nearest', 'bilinear')
+MODES = ('fill', 'line', 'point')
+LIGHT_DIRECTION = np.array((0.0, 0.0, 1.0), dtype=np.float32)
+AMBIENT = 0.2
+
+
+def fixed_lighting(colors, normals, modelview):
+    # The fixed-function defaults the labs rely on: GL_LIGHT0 as a white
+    # directional light along +z in eye space, 0.2 global ambient, and
+    # GL_COLOR_MATERIAL feeding the vertex color into ambient and diffuse.
+    linear = np.asarray(modelview, dtype=np.float64)[:3, :3]
+    eye = np.asarray(normals, dtype=np.float32) @ np.linalg.inv(linear).astype(np.float32)
+    eye /= np.maximum(np.linalg.norm(eye, axis=1, keepdims=True), 1e-12)
+    diffuse = np.maximum(eye @ LIGHT_DIRECTION, 0.0)
+    return np.minimum(colors * (AMBIENT + diffuse[:, np.newaxis]), 1.0)
+
+
+def sample(texture, uv, sampling='bilinear'):
+    # GL_REPEAT addressing; row 0 of the array is t = 0, as it is uploaded.
+    height, width = texture.shape[:2]
+    if sampling == 'nearest':
+        x = np.floor(uv[:, 0] * width).astype(np.int64) % width
+        y = np.floor(uv[:, 1] * height).astype(np.int64) % height
+        return texture[y, x].astype(np.float32) / 255.0
+
+    u = uv[:, 0] * width - 0.5
+    v = uv[:, 1] * height - 0.5
+    x0 = np.floor(u)
+    y0 = np.floor(v)
+    fx = (u - x0).astype(np.float32)[:, np.newaxis]
+    fy = (v - y0).astype(np.float32)[:, np.newaxis]
+    x0 = x0.astype(np.int64) % width
+    y0 = y0.astype(np.int64) % height
+    x1 = (x0 + 1) % width
+    y1 = (y0 + 1) % height
+    bottom = texture[y0, x0] * (1.0 - fx) + texture[y0, x1] * fx
+    top = texture[y1, x0] * (1.0 - fx) + texture[y1, x1] * fx
+    return (bottom * (1.0 - fy) + top * fy) / 255.0
+
+
+def columns(array):
+    return [np.ascontiguousarray(array[:, j], dtype=np.float32) for j in range(array.shape[1])]
+
+
+def interpolate(weights, corners, index):
+    # corners holds each triangle's three vertex values: (triangles, 3, n).
+    result = np.empty((len(index), corners.shape[2]), dtype=np.float32)
+    for channel in range(corners.shape[2]):
+        values = columns(corners[:, :, channel])
+        result[:, channel] = sum(weight * value.take(index) for weight, value in zip(weights, values))
+    return result
+
+
+class Rasterizer:
+    # Pure NumPy triangle rasterizer for machines without a GL context and
+    # as a reference image for the GL paths. Each draw() sets up one edge
+    # function per triangle side, splits every triangle's bounding box into
+    # TILE x TILE tiles and classifies whole batches of tiles at once: tiles
+    # outside an edge are skipped, tiles inside all three need no per-pixel
+    # test. Fragments are depth-resolved per pixel before anything is
+    # shaded, so only visible fragments are interpolated, lit or textured.
+    def __init__(self, width, height, shading='gouraud', sampling='bilinear', tile=TILE):
+        if shading not in SHADING:
+            raise ValueError('Unknown shading: %s' % shading)
+        if sampling not in SAMPLING:
+            raise ValueError('Unknown sampling: %s' % sampling)
+        self.width = width
+        self.height = height
+        self.shading = shading
+        self.sampling = sampling
+        self.tile = tile
+        self.color = np.zeros((height * width, 3), dtype=np.float32)
+        self.depth = np.ones(height * width, dtype=np.float32)
+        self.stats = {'triangles': 0, 'tiles': 0, 'fragments': 0}
+
+    def clear(self, color=(0.0, 0.0, 0.0), depth=1.0):
+        self.color[:] = color
+        self.depth[:] = depth
+        self.stats = {'triangles': 0, 'tiles': 0, 'fragments': 0}
+
+    def image(self):
+        # Top row first, like headless.read_frame.
+        pixels = np.clip(self.color, 0.0, 1.0) * 255.0 + 0.5
+        return pixels.astype(np.uint8).reshape(self.height, self.width, 3)
+
+    def draw_mesh(self, mesh, modelview, projection, lighting=False, colors=None, mode='fill', size=1.0):
+        self.draw(mesh.positions, mesh.triangles, modelview, projection,
+                  mesh.colors if colors is None else colors, mesh.normals, lighting,
+                  mode=mode, size=size, edges=mesh.edges)
+
+    def draw(self, positions, triangles, modelview, projection, colors=(1.0, 1.0, 1.0), normals=None,
+             lighting=False, uvs=None, texture=None, texture_scale=1.0, mode='fill', size=1.0, edges=None):
+        # mode follows glPolygonMode; size is the line width or point size.
+        # Line mode draws the given edges, the polygon outlines drawn by
+        # gl_mesh, or every triangle edge when there are none.
+        if mode not in MODES:
+            raise ValueError('Unknown polygon mode: %s' % mode)
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        colors = np.broadcast_to(np.asarray(colors, dtype=np.float32), positions.shape)
+        if lighting:
+            colors = fixed_lighting(colors, normals, modelview)
+
+        mvp = np.asarray(projection, dtype=np.float64) @ np.asarray(modelview, dtype=np.float64)
+        clip = positions @ mvp[:, :3].T.astype(np.float32) + mvp[:, 3].astype(np.float32)
+        triangles = self.visible(clip, triangles)
+        if not len(triangles):
+            return
+
+        w = clip[:, 3]
+        window = np.empty((len(clip), 3), dtype=np.float64)
+        window[:, 0] = (clip[:, 0] / w + 1.0) * 0.5 * self.width
+        window[:, 1] = (1.0 - clip[:, 1] / w) * 0.5 * self.height
+        window[:, 2] = (clip[:, 2] / w + 1.0) * 0.5
+        if mode == 'line':
+            if edges is None:
+                edges = np.stack([triangles, triangles[:, [1, 2, 0]]], axis=2).reshape(-1, 2)
+            else:
+                edges = self.visible(clip, np.asarray(edges, dtype=np.int64).reshape(-1, 2))
+            self.draw_edges(window, edges, colors, size)
+            return
+        if mode == 'point':
+            self.draw_points(window, triangles, colors, size)
+            return
+
+        keep, edges, bounds = self.setup(window[triangles])
+        if not len(keep):
+            return
+        triangles = triangles[keep]
+        pixel, index, px, py = self.cover(edges, bounds)
+
+        # Window-space depth is affine in x and y, so it is a plane per triangle.
+        # Per-triangle values reach fragments through one-dimensional takes,
+        # which are several times faster than gathering whole rows.
+        za, zb, zc = columns(np.einsum('eti,te->ti', edges, window[triangles][:, :, 2]))
+        z = za.take(index) * px + zb.take(index) * py + zc.take(index)
+        winners = self.resolve(pixel, index, z)
+        if not len(winners):
+            return
+        pixel, index, px, py = pixel[winners], index[winners], px[winners], py[winners]
+
+        if self.shading == 'flat':
+            # GL_FLAT takes the last vertex of each triangle.
+            color = np.stack([values.take(index) for values in columns(colors[triangles[:, 2]])], axis=1)
+        else:
+            color = None
+        if self.shading == 'gouraud' or texture is not None:
+            # Screen-space barycentrics to perspective-correct weights.
+            inverse_w = columns((1.0 / w)[triangles])
+            weights = []
+            for i in range(3):
+                a, b, c = columns(edges[i])
+                weights.append((a.take(index) * px + b.take(index) * py + c.take(index)) * inverse_w[i].take(index))
+            total = weights[0] + weights[1] + weights[2]
+            weights = [weight / total for weight in weights]
+            if color is None:
+                color = interpolate(weights, colors[triangles], index)
+        if texture is not None:
+            uv = interpolate(weights, np.asarray(uvs, dtype=np.float32)[triangles], index)
+            # GL_DECAL with an RGB texture replaces the fragment color.
+            color = sample(texture, uv * texture_scale, self.sampling)
+        self.color[pixel] = color
+
+    def draw_edges(self, window, edges, colors, width):
+        # Lines are stepped one fragment per pixel along their major axis and
+        # widened across the minor axis, like GL's aliased wide lines. Flat
+        # shading takes the second vertex, GL's provoking vertex for lines.
+        starts, ends = edges[:, 0], edges[:, 1]
+        if self.shading == 'flat':
+            start_color = end_color = colors[ends]
+        else:
+            start_color, end_color = colors[starts], colors[ends]
+        delta = window[ends] - window[starts]
+        x_major = np.abs(delta[:, 0]) >= np.abs(delta[:, 1])
+        steps = np.ceil(np.maximum(np.abs(delta[:, 0]), np.abs(delta[:, 1]))).astype(np.int64) + 1
+        edge = np.repeat(np.arange(len(edges)), steps)
+        step = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+        t = (step / np.maximum(steps - 1, 1)[edge])[:, np.newaxis]
+        points = window[starts][edge] + delta[edge] * t
+        color = (start_color[edge] * (1.0 - t) + end_color[edge] * t).astype(np.float32)
+
+        thickness = max(int(round(width)), 1)
+        offsets = np.arange(thickness) - (thickness - 1) // 2
+        across = x_major[edge].astype(np.int64)[:, np.newaxis]
+        x = np.floor(points[:, 0])[:, np.newaxis] + (1 - across) * offsets
+        y = np.floor(points[:, 1])[:, np.newaxis] + across * offsets
+        count = len(offsets)
+        self.splat(x.ravel(), y.ravel(), np.repeat(points[:, 2], count),
+                   np.repeat(edge, count), np.repeat(color, count, axis=0))
+
+    def draw_points(self, window, triangles, colors, size):
+        # Every vertex of a drawn triangle becomes a disc of the given
+        # diameter, as with GL_POINT_SMOOTH, at the vertex's depth.
+        vertices = np.unique(triangles)
+        centres = window[vertices]
+        radius = max(size, 1.0) * 0.5
+        grid = np.arange(-int(np.ceil(radius)), int(np.ceil(radius)) + 1)
+        dx, dy = (offset.ravel() for offset in np.meshgrid(grid, grid))
+        x = np.floor(centres[:, 0])[:, np.newaxis] + dx
+        y = np.floor(centres[:, 1])[:, np.newaxis] + dy
+        disc = (x + 0.5 - centres[:, 0:1]) ** 2 + (y + 0.5 - centres[:, 1:2]) ** 2 <= radius * radius
+        point = np.nonzero(disc)[0]
+        self.splat(x[disc], y[disc], centres[point, 2], point, colors[vertices][point])
+
+    def splat(self, x, y, z, index, color):
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height) & (z >= 0.0) & (z <= 1.0)
+        pixel = (y[inside] * self.width + x[inside]).astype(np.int64)
+        index, z, color = index[inside], z[inside].astype(np.float32), color[inside]
+        self.stats['fragments'] += len(pixel)
+        winners = self.resolve(pixel, index, z)
+        self.color[pixel[winners]] = color[winners]
+
+    def visible(self, clip, primitives):
+        # Triangles or edges entirely outside one clip plane are rejected.
+        # Those crossing the near plane are dropped rather than clipped; none
+        # of the lab cameras get that close to their geometry.
+        corners = clip[primitives]
+        w = corners[:, :, 3]
+        outside = np.any(w <= 1e-6, axis=1) | np.any(corners[:, :, 2] < -w, axis=1)
+        for axis in range(3):
+            outside |= np.all(corners[:, :, axis] > w, axis=1)
+            outside |= np.all(corners[:, :, axis] < -w, axis=1)
+        return primitives[~outside]
+
+    def setup(self, window):
+        x = window[:, :, 0]
+        y = window[:, :, 1]
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+
+        # Pixel centres inside the bounding box, clipped to the viewport.
+        x0 = np.maximum(np.ceil(x.min(axis=1) - 0.5), 0).astype(np.int64)
+        x1 = np.minimum(np.floor(x.max(axis=1) - 0.5), self.width - 1).astype(np.int64)
+        y0 = np.maximum(np.ceil(y.min(axis=1) - 0.5), 0).astype(np.int64)
+        y1 = np.minimum(np.floor(y.max(axis=1) - 0.5), self.height - 1).astype(np.int64)
+        keep = np.flatnonzero((np.abs(area) > 1e-12) & (x1 >= x0) & (y1 >= y0))
+        self.stats['triangles'] += len(keep)
+
+        # edges[i, t] = (a, b, c) with a * px + b * py + c the barycentric
+        # weight of vertex i: zero on the opposite side, one at the vertex.
+        # Dividing by the signed area makes both windings positive inside.
+        x, y, area = x[keep], y[keep], area[keep]
+        edges = np.empty((3, len(keep), 3), dtype=np.float64)
+        for i in range(3):
+            j, k = (i + 1) % 3, (i + 2) % 3
+            edges[i, :, 0] = (y[:, j] - y[:, k]) / area
+            edges[i, :, 1] = (x[:, k] - x[:, j]) / area
+            edges[i, :, 2] = (x[:, j] * y[:, k] - x[:, k] * y[:, j]) / area
+        return keep, edges, (x0[keep], y0[keep], x1[keep], y1[keep])
+
+    def cover(self, edges, bounds):
+        x0, y0, x1, y1 = bounds
+        t = self.tile
+        tx0, ty0 = x0 // t, y0 // t
+        columns = x1 // t - tx0 + 1
+        counts = columns * (y1 // t - ty0 + 1)
+        owner = np.repeat(np.arange(len(x0)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        tile_x = ((tx0[owner] + local % columns[owner]) * t).astype(np.int32)
+        tile_y = ((ty0[owner] + local // columns[owner]) * t).astype(np.int32)
+
+        # Each edge function at the first pixel centre of every tile, and its
+        # range across the tile: a tile below zero on any edge is empty, one
+        # at or above zero on all three is covered completely.
+        a, b, c = edges[:, owner, 0], edges[:, owner, 1], edges[:, owner, 2]
+        origin = a * (tile_x + 0.5) + b * (tile_y + 0.5) + c
+        span = t - 1
+        high = origin + (np.maximum(a, 0.0) + np.maximum(b, 0.0)) * span
+        low = origin + (np.minimum(a, 0.0) + np.minimum(b, 0.0)) * span
+        occupied = np.all(high >= 0.0, axis=0)
+        full = np.all(low >= 0.0, axis=0) & (tile_x + t <= self.width) & (tile_y + t <= self.height)
+        self.stats['tiles'] += int(occupied.sum())
+
+        # Fully covered tiles emit every pixel without evaluating anything.
+        steps = np.arange(t, dtype=np.int32)
+        grid_x = np.tile(steps, t)
+        grid_y = np.repeat(steps, t)
+        xs = [(tile_x[full][:, np.newaxis] + grid_x).ravel()]
+        ys = [(tile_y[full][:, np.newaxis] + grid_y).ravel()]
+        indices = [np.repeat(owner[full], t * t)]
+
+        partial = occupied & ~full
+        owner, tile_x, tile_y = owner[partial], tile_x[partial], tile_y[partial]
+        a, b, origin = a[:, partial].astype(np.float32), b[:, partial].astype(np.float32), origin[:, partial].astype(np.float32)
+        steps = steps.astype(np.float32)
+        for start in range(0, len(owner), TILE_BATCH):
+            batch = slice(start, start + TILE_BATCH)
+            ox, oy = tile_x[batch], tile_y[batch]
+            inside = ((ox[:, np.newaxis, np.newaxis] + steps[np.newaxis, np.newaxis, :] < self.width) &
+                      (oy[:, np.newaxis, np.newaxis] + steps[np.newaxis, :, np.newaxis] < self.height))
+            for i in range(3):
+                # Stepped across the tile in float32 from an origin computed
+                # in float64.
+                value = (origin[i, batch][:, np.newaxis, np.newaxis] +
+                         b[i, batch][:, np.newaxis, np.newaxis] * steps[np.newaxis, :, np.newaxis] +
+                         a[i, batch][:, np.newaxis, np.newaxis] * steps[np.newaxis, np.newaxis, :])
+                inside &= value >= 0.0
+            k, iy, ix = np.nonzero(inside)
+            xs.append(ox.take(k) + ix)
+            ys.append(oy.take(k) + iy)
+            indices.append(owner[batch].take(k))
+
+        px = np.concatenate(xs)
+        py = np.concatenate(ys)
+        pixel = py * self.width + px
+        self.stats['fragments'] += len(pixel)
+        return pixel, np.concatenate(indices), px.astype(np.float32) + 0.5, py.astype(np.float32) + 0.5
+
+    def resolve(self, pixel, index, z):
+        # Nearest fragment per pixel, then GL_LESS against the depth buffer.
+        # Depth bits and triangle order are packed into one integer key, so a
+        # single scatter-minimum finds the winner, and on equal depth the
+        # earlier triangle wins, as it would in GL. Non-negative float32 bit
+        # patterns sort like their values.
+        z = np.maximum(z, 0.0)
+        key = (z.view(np.int32).astype(np.int64) << 32) | index
+        best = np.full(self.width * self.height, np.iinfo(np.int64).max)
+        np.minimum.at(best, pixel, key)
+        first = best[pixel] == key
+        first &= z < self.depth[pixel]
+        winners = np.flatnonzero(first)
+        self.depth[pixel[winners]] = z[winners]
+        return winners
@@ -0,0 +1,155 @@
+import numpy as np
+from OpenGL.GL import *
+
+import matrices
+from gl_state import GLState
+
+
+class Material:
+    def __init__(self, name, lighting=False, texture=None, program=None, uniforms=None):
+        self.name = name
+        self.lighting = lighting
+        self.texture = texture
+        self.program = program
+        self.uniforms = uniforms or {}
+
+    def key(self):
+        program = self.program.program if self.program is not None else 0
+        return (program, self.texture or 0, self.lighting, id(self))
+
+    def apply(self, state):
+        if self.lighting:
+            state.enable(GL_LIGHTING)
+            state.enable(GL_LIGHT0)
+            state.enable(GL_COLOR_MATERIAL)
+        else:
+            state.disable(GL_LIGHTING)
+        if self.texture is not None:
+            state.enable(GL_TEXTURE_2D)
+            state.bind_texture(GL_TEXTURE_2D, self.texture)
+        if self.program is not None:
+            self.program.use()
+            for name, value in self.uniforms.items():
+                self.program.set_float(name, value)
+
+    def release(self, state):
+        if self.program is not None:
+            self.program.release()
+        if self.texture is not None:
+            state.disable(GL_TEXTURE_2D)
+
+
+NO_MATERIAL_KEY = (0, 0, False, 0)
+
+
+class Callback:
+    # Lets immediate-mode or CPU-colored drawing sit in the graph like a mesh.
+    def __init__(self, func, bounds=None):
+        self.func = func
+        self.bounds = bounds
+
+    def draw(self, mode='fill'):
+        self.func()
+
+
+class Node:
+    def __init__(self, name, mesh=None, material=None, transform=None, bounds=None):
+        self.name = name
+        self.mesh = mesh
+        self.material = material
+        self.transform = matrices.identity() if transform is None else transform
+        self.bounds = bounds
+        self.visible = True
+        self.children = []
+
+    def add(self, node):
+        self.children.append(node)
+        return node
+
+    def local_bounds(self):
+        if self.bounds is not None:
+            return self.bounds
+        return getattr(self.mesh, 'bounds', None)
+
+    def material_key(self):
+        return self.material.key() if self.material is not None else NO_MATERIAL_KEY
+
+    def walk(self, parent=None):
+        if not self.visible:
+            return
+        world = self.transform if parent is None else parent @ self.transform
+        yield self, world
+        for child in self.children:
+            yield from child.walk(world)
+
+
+class Scene:
+    def __init__(self, state=None):
+        self.root = Node('root')
+        self.state = state if state is not None else GLState()
+        self.stats = {'nodes': 0, 'visible': 0, 'culled': 0, 'batches': 0}
+
+    def add(self, node):
+        return self.root.add(node)
+
+    def cull(self, view, projection):
+        items = [(node, world) for node, world in self.root.walk() if node.mesh is not None]
+        if not items:
+            return []
+
+        worlds = np.array([world for _, world in items], dtype=np.float64)
+        centers = np.zeros((len(items), 3))
+        radii = np.full(len(items), np.inf)
+        for i, (node, _) in enumerate(items):
+            bounds = node.local_bounds()
+            if bounds is not None:
+                centers[i], radii[i] = bounds
+
+        # Bounding spheres to world space: the radius grows with the largest
+        # axis scale so non-uniformly scaled nodes are never culled wrongly.
+        linear = worlds[:, :3, :3]
+        centers = np.einsum('kij,kj->ki', linear, centers) + worlds[:, :3, 3]
+        radii = radii * np.linalg.norm(linear, axis=1).max(axis=1)
+
+        planes = matrices.frustum_planes(np.asarray(projection) @ np.asarray(view))
+        visible = matrices.spheres_visible(planes, centers, radii)
+        self.stats['nodes'] = len(items)
+        self.stats['visible'] = int(visible.sum())
+        self.stats['culled'] = len(items) - self.stats['visible']
+        return [item for item, keep in zip(items, visible) if keep]
+
+    def select_levels(self, visible, view, projection, viewport_height):
+        # Meshes with several tessellation levels pick one from the screen
+        # scale at their bounding sphere centre this frame.
+        for node, world in visible:
+            if hasattr(node.mesh, 'select'):
+                center = node.local_bounds()[0]
+                node.mesh.select(matrices.pixels_per_unit(view @ world, projection, viewport_height, center))
+
+    def draw(self, view, projection, mode='fill', viewport_height=None):
+        # The modelview matrix must already hold `view`; node transforms are
+        # multiplied onto it. Visible nodes are drawn grouped by material so
+        # each program, texture and lighting switch happens once per batch.
+        visible = self.cull(view, projection)
+        if viewport_height is not None:
+            self.select_levels(visible, view, projection, viewport_height)
+        visible.sort(key=lambda item: item[0].material_key())
+
+        current = None
+        batches = 0
+        for node, world in visible:
+            if batches == 0 or node.material is not current:
+                if current is not None:
+                    current.release(self.state)
+                if node.material is not None:
+                    node.material.apply(self.state)
+                current = node.material
+                batches += 1
+            glPushMatrix()
+            glMultMatrixf(world.T)
+            node.mesh.draw(mode)
+            glPopMatrix()
+        if current is not None:
+            current.release(self.state)
+        self.stats['batches'] = batches
+        return visible
@@ -0,0 +1,57 @@
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+
+
+class ShaderProgram:
+    def __init__(self, vertex_source, fragment_source, attributes=None):
+        vertex = shaders.compileShader(vertex_source, GL_VERTEX_SHADER)
+        fragment = shaders.compileShader(fragment_source, GL_FRAGMENT_SHADER)
+        self.program = glCreateProgram()
+        glAttachShader(self.program, vertex)
+        glAttachShader(self.program, fragment)
+        for location, name in (attributes or {}).items():
+            glBindAttribLocation(self.program, location, name)
+        glLinkProgram(self.program)
+        glDeleteShader(vertex)
+        glDeleteShader(fragment)
+        if glGetProgramiv(self.program, GL_LINK_STATUS) != GL_TRUE:
+            log = glGetProgramInfoLog(self.program)
+            glDeleteProgram(self.program)
+            raise RuntimeError('Shader link failed: %s' % log)
+        self.locations = {}
+        self.matrices = {}
+
+    def location(self, name):
+        if name not in self.locations:
+            self.locations[name] = glGetUniformLocation(self.program, name)
+        return self.locations[name]
+
+    def use(self):
+        glUseProgram(self.program)
+
+    def release(self):
+        glUseProgram(0)
+
+    def set_float(self, name, value):
+        glUniform1f(self.location(name), value)
+
+    def set_int(self, name, value):
+        glUniform1i(self.location(name), value)
+
+    def set_vec2(self, name, x, y):
+        glUniform2f(self.location(name), x, y)
+
+    def set_matrix(self, name, matrix):
+        # Uniforms keep their value in the program object, so an unchanged
+        # matrix is not uploaded again.
+        previous = self.matrices.get(name)
+        if previous is not None and np.array_equal(previous, matrix):
+            return False
+        glUniformMatrix4fv(self.location(name), 1, GL_TRUE, matrix)
+        self.matrices[name] = np.array(matrix, dtype=np.float32)
+        return True
+
+    def delete(self):
+        glDeleteProgram(self.program)
+        self.program = None
@@ -0,0 +1,119 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from bmp import BI_RGB, row_stride
+
+BAND_ROWS = 32
+BMP_HEADER_SIZE = 14 + 40
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def bands(func, width, height=None, band_rows=BAND_ROWS, **params):
+    # Yields (y0, rows) top to bottom. The same buffer is refilled for every
+    # band, so memory use depends on width and band_rows, never on height.
+    if height is None:
+        height = width
+    buffer = np.empty((band_rows, width, 3), dtype=np.uint8)
+    for y0 in range(0, height, band_rows):
+        y1 = min(y0 + band_rows, height)
+        out = buffer[:y1 - y0]
+        func(width=width, height=height, out=out, y0=y0, y1=y1, **params)
+        yield y0, out
+
+
+def bmp_header(width, height):
+    stride = row_stride(width, 24)
+    image_size = stride * height
+    file_size = BMP_HEADER_SIZE + image_size
+    if file_size > 0xFFFFFFFF:
+        raise ValueError('%dx%d does not fit in a BMP file; use raw or PNG output' % (width, height))
+    return (struct.pack('<2sIHHI', b'BM', file_size, 0, 0, BMP_HEADER_SIZE) +
+            struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, BI_RGB, image_size, 0, 0, 0, 0))
+
+
+def write_bmp(path, width, height, rows):
+    # BMP stores rows bottom-up, so each top-down band is written reversed at
+    # its final offset in a file that is sized up front.
+    stride = row_stride(width, 24)
+    padded = None
+    with open(path, 'wb') as f:
+        f.write(bmp_header(width, height))
+        f.truncate(BMP_HEADER_SIZE + stride * height)
+        for y0, band in rows:
+            n = band.shape[0]
+            if padded is None or padded.shape[0] < n:
+                padded = np.zeros((n, stride), dtype=np.uint8)
+            out = padded[:n]
+            out[:, :width * 3].reshape(n, width, 3)[...] = band[::-1, :, ::-1]
+            f.seek(BMP_HEADER_SIZE + (height - y0 - n) * stride)
+            f.write(out.data)
+
+
+def _png_chunk(f, kind, data):
+    f.write(struct.pack('>I', len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+
+def write_png(path, width, height, rows, level=6):
+    compressor = zlib.compressobj(level)
+    filtered = None
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        _png_chunk(f, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        for _, band in rows:
+            n = band.shape[0]
+            if filtered is None or filtered.shape[0] < n:
+                # Every scanline starts with filter type 0 (None).
+                filtered = np.zeros((n, 1 + width * 3), dtype=np.uint8)
+            out = filtered[:n]
+            out[:, 1:] = band.reshape(n, width * 3)
+            data = compressor.compress(out.data)
+            if data:
+                _png_chunk(f, b'IDAT', data)
+        _png_chunk(f, b'IDAT', compressor.flush())
+        _png_chunk(f, b'IEND', b'')
+
+
+def write_raw(path, width, height, rows):
+    with open(path, 'wb') as f:
+        for _, band in rows:
+            f.write(np.ascontiguousarray(band).data)
+
+
+WRITERS = {
+    '.bmp': write_bmp,
+    '.png': write_png,
+    '.raw': write_raw,
+    '.rgb': write_raw,
+}
+
+
+def array_bands(array, band_rows=BAND_ROWS):
+    # Bands of an existing array, e.g. a cached memmap, for the writers above.
+    for y0 in range(0, array.shape[0], band_rows):
+        yield y0, array[y0:y0 + band_rows]
+
+
+def _writer(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError('Unsupported output format: %s' % ext)
+    return WRITERS[ext]
+
+
+def write_array(path, array, band_rows=BAND_ROWS):
+    height, width = array.shape[:2]
+    _writer(path)(path, width, height, array_bands(array, band_rows))
+    return path
+
+
+def stream_texture(func, path, width, height=None, band_rows=BAND_ROWS, **params):
+    if height is None:
+        height = width
+    _writer(path)(path, width, height, bands(func, width, height, band_rows, **params))
+    return path
@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# GL tests render without a display unless another backend is asked for.
+os.environ.setdefault('HEADLESS_BACKEND', 'egl')
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from atlas import SkylinePacker, build_atlas, max_mip_level, pack
+
+
+def overlaps(a, b):
+    (ax, ay, aw, ah), (bx, by, bw, bh) = a, b
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+def test_packer_rejects_oversized_rects():
+    packer = SkylinePacker(64, 32)
+    assert packer.insert(65, 1) is None
+    assert packer.insert(1, 33) is None
+    assert packer.insert(64, 32) == (0, 0)
+
+
+def test_packer_fills_until_full():
+    packer = SkylinePacker(64, 64)
+    sizes = np.random.default_rng(0).integers(4, 20, (200, 2))
+    placed = []
+    for w, h in sizes:
+        spot = packer.insert(int(w), int(h))
+        if spot is None:
+            break
+        placed.append((spot[0], spot[1], int(w), int(h)))
+    # The sizes add up to far more than the bin, so the packer runs out.
+    assert spot is None
+    assert packer.used_height() <= 64
+    for i, (x, y, w, h) in enumerate(placed):
+        assert 0 <= x and x + w <= 64 and 0 <= y and y + h <= 64
+        assert not any(overlaps(placed[i], other) for other in placed[:i])
+
+
+def test_full_packer_still_places_what_fits():
+    packer = SkylinePacker(32, 32)
+    assert packer.insert(32, 30) == (0, 0)
+    assert packer.insert(4, 4) is None
+    assert packer.insert(32, 2) == (0, 30)
+    assert packer.insert(1, 1) is None
+
+
+def test_pack_raises_when_max_size_overflows():
+    with pytest.raises(ValueError, match='do not fit'):
+        pack({name: (30, 30) for name in 'abcde'}, padding=0, max_size=64)
+
+
+def test_pack_counts_padding_against_max_size():
+    rects, width, height = pack({'a': (64, 64)}, padding=0, max_size=64)
+    assert rects == {'a': (0, 0, 64, 64)} and (width, height) == (64, 64)
+    with pytest.raises(ValueError):
+        pack({'a': (64, 64)}, padding=1, max_size=64)
+
+
+def test_padding_is_extruded_edges():
+    tile = np.arange(4 * 3 * 3, dtype=np.uint8).reshape(4, 3, 3)
+    atlas = build_atlas({'a': tile, 'b': tile[::-1]}, padding=2)
+    for name, image in (('a', tile), ('b', tile[::-1])):
+        x, y, w, h = atlas.rects[name]
+        area = atlas.image[y - 2:y + h + 2, x - 2:x + w + 2]
+        assert np.array_equal(area, np.pad(image, ((2, 2), (2, 2), (0, 0)), mode='edge'))
+    assert atlas.max_level == max_mip_level(2) == 1
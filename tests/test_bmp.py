@@ -0,0 +1,84 @@
+import struct
+
+import numpy as np
+import pytest
+
+from bmp import BI_BITFIELDS, BI_RGB, UnsupportedBmp, read_bmp, row_stride
+
+RGB_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF)
+PIXELS = np.array([
+    [(255, 0, 0), (0, 255, 0), (0, 0, 255)],
+    [(10, 20, 30), (40, 50, 60), (70, 80, 90)],
+], dtype=np.uint8)
+
+
+def write_bmp(path, rows, bits=24, masks=None, top_down=False):
+    # rows are stored as given, so bottom-up unless top_down is set.
+    height, width = rows.shape[:2]
+    stride = row_stride(width, bits)
+    extra = b'' if masks is None else struct.pack('<III', *masks)
+    offset = 54 + len(extra)
+    data = bytearray(stride * height)
+    for y, row in enumerate(rows):
+        pixels = np.zeros((width, bits // 8), dtype=np.uint8)
+        pixels[:, :3] = row[:, ::-1]
+        data[y * stride:y * stride + pixels.size] = pixels.tobytes()
+    compression = BI_RGB if masks is None else BI_BITFIELDS
+    header = struct.pack('<2sIHHI', b'BM', offset + len(data), 0, 0, offset)
+    header += struct.pack('<IiiHHIIiiII', 40, width, -height if top_down else height,
+                          1, bits, compression, len(data), 0, 0, 0, 0)
+    path.write_bytes(header + extra + bytes(data))
+    return str(path)
+
+
+def test_reads_24_bit_rows_bottom_up(tmp_path):
+    image = read_bmp(write_bmp(tmp_path / 'a.bmp', PIXELS))
+    assert np.array_equal(image, PIXELS)
+
+
+def test_top_down_rows_are_flipped(tmp_path):
+    image = read_bmp(write_bmp(tmp_path / 'a.bmp', PIXELS, top_down=True))
+    assert np.array_equal(image, PIXELS[::-1])
+
+
+def test_reads_32_bit_bitfields(tmp_path):
+    image = read_bmp(write_bmp(tmp_path / 'a.bmp', PIXELS, bits=32, masks=RGB_MASKS))
+    assert np.array_equal(image, PIXELS)
+
+
+def test_rejects_unusual_masks(tmp_path):
+    path = write_bmp(tmp_path / 'a.bmp', PIXELS, bits=32, masks=(0xFF, 0xFF00, 0xFF0000))
+    with pytest.raises(UnsupportedBmp, match='masks'):
+        read_bmp(path)
+
+
+def test_rejects_truncated_masks(tmp_path):
+    path = tmp_path / 'a.bmp'
+    write_bmp(path, PIXELS, bits=32, masks=RGB_MASKS)
+    path.write_bytes(path.read_bytes()[:60])
+    with pytest.raises(UnsupportedBmp, match='channel masks'):
+        read_bmp(str(path))
+
+
+@pytest.mark.parametrize('size', [0, 2, 53])
+def test_rejects_short_files(tmp_path, size):
+    path = tmp_path / 'a.bmp'
+    write_bmp(path, PIXELS)
+    path.write_bytes(path.read_bytes()[:size])
+    with pytest.raises(UnsupportedBmp, match='truncated header'):
+        read_bmp(str(path))
+
+
+def test_rejects_truncated_pixels(tmp_path):
+    path = tmp_path / 'a.bmp'
+    write_bmp(path, PIXELS)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(UnsupportedBmp, match='truncated pixel data'):
+        read_bmp(str(path))
+
+
+def test_rejects_other_formats(tmp_path):
+    path = tmp_path / 'a.bmp'
+    path.write_bytes(b'\x89PNG' + bytes(100))
+    with pytest.raises(UnsupportedBmp, match='not a BMP'):
+        read_bmp(str(path))
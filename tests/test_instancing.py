@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt5')
+headless = pytest.importorskip('headless')
+
+SIZE = 320, 240
+INSTANCES = 64
+
+
+def render(scene, setup=None):
+    try:
+        images, _ = headless.render_scene(scene, 1, *SIZE, setup=setup)
+    except Exception as e:
+        pytest.skip('no offscreen GL context: %s' % e)
+    return images[0].astype(np.int16)
+
+
+def use_instanced(widget):
+    if widget.instanced_program is None:
+        pytest.skip('instanced rendering is unavailable')
+
+
+def use_fallback(widget):
+    widget.instanced_program = None
+
+
+@pytest.mark.parametrize('layout', ['grid', 'random'])
+@pytest.mark.parametrize('mode', headless.LAB2_MODES)
+@pytest.mark.parametrize('shape', headless.LAB2_SHAPES)
+def test_instanced_matches_fallback(shape, mode, layout):
+    scene = 'lab2:%s:%s:%d:%s' % (shape, mode, INSTANCES, layout)
+    instanced = render(scene, use_instanced)
+    fallback = render(scene, use_fallback)
+    # The shader transforms vertices in a different order than the fixed
+    # pipeline, which may move a rasterized edge by a pixel here and there.
+    diff = np.abs(instanced - fallback).max(axis=-1)
+    assert (diff > 16).sum() <= 0.001 * diff.size
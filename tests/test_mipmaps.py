@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from mipmaps import build_mip_chain, downsample, level_sizes, pack_chain, unpack_chain
+
+
+def image(width, height, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def test_level_sizes_of_npot_texture():
+    assert level_sizes(5, 3) == [(5, 3), (2, 1), (1, 1)]
+    assert level_sizes(1, 6) == [(1, 6), (1, 3), (1, 1)]
+
+
+@pytest.mark.parametrize('method', ['box', 'lanczos'])
+@pytest.mark.parametrize('width, height', [(8, 8), (7, 5), (1, 9), (300, 1)])
+def test_chain_follows_level_sizes(width, height, method):
+    chain = build_mip_chain(image(width, height), method)
+    assert [level.shape[1::-1] for level in chain] == level_sizes(width, height)
+    assert all(level.dtype == np.uint8 for level in chain)
+
+
+def test_box_filter_averages_pairs():
+    level = np.array([[[0] * 3, [100] * 3, [7] * 3],
+                      [[50] * 3, [150] * 3, [7] * 3]], dtype=np.uint8)
+    # The odd last column has no partner and is dropped: NPOT sizes round down.
+    assert downsample(level).tolist() == [[[75] * 3]]
+
+
+def test_lanczos_keeps_flat_color():
+    flat = np.full((6, 10, 3), 90, dtype=np.uint8)
+    assert (downsample(flat, 'lanczos') == 90).all()
+
+
+@pytest.mark.parametrize('method', ['box', 'lanczos'])
+@pytest.mark.parametrize('width, height', [(16, 16), (13, 6), (1, 5)])
+def test_pack_round_trip(width, height, method):
+    base = image(width, height)
+    packed = pack_chain(base, method)
+    levels = unpack_chain(packed, width, height)
+    expected = build_mip_chain(base, method)[1:]
+    assert len(levels) == len(expected)
+    for level, reference in zip(levels, expected):
+        assert np.array_equal(level, reference)
+    assert packed.size == sum(level.size for level in expected)
+
+
+def test_pack_single_pixel():
+    packed = pack_chain(image(1, 1))
+    assert packed.size == 0
+    assert unpack_chain(packed, 1, 1) == []
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from texture_cache import TextureCache
+
+ENTRY_BYTES = 128 + 16 * 16 * 3
+
+
+def texture(value):
+    return np.full((16, 16, 3), value, dtype=np.uint8)
+
+
+def age(cache, key, seconds):
+    os.utime(cache.path(key), (seconds, seconds))
+
+
+def test_get_or_create_generates_once(tmp_path):
+    cache = TextureCache(str(tmp_path))
+    calls = []
+
+    def generate(value):
+        calls.append(value)
+        return texture(value)
+
+    first = cache.get_or_create('flat', generate, value=7)
+    second = cache.get_or_create('flat', generate, value=7)
+    assert calls == [7]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.array_equal(first, second)
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TextureCache(str(tmp_path), max_bytes=2 * ENTRY_BYTES)
+    cache.put('a', texture(1))
+    cache.put('b', texture(2))
+    age(cache, 'a', 1000)
+    age(cache, 'b', 2000)
+    # A hit refreshes 'a', which leaves 'b' as the oldest entry.
+    assert cache.get('a') is not None
+    cache.put('c', texture(3))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_eviction_keeps_the_new_entry(tmp_path):
+    cache = TextureCache(str(tmp_path), max_bytes=1)
+    cache.put('a', texture(1))
+    assert np.array_equal(cache.put('b', texture(2)), texture(2))
+    assert cache.get('a') is None
+    assert [os.path.basename(path) for _, _, path in cache.entries()] == ['b.npy']
+
+
+def test_failed_write_leaves_previous_entry(tmp_path):
+    cache = TextureCache(str(tmp_path))
+    cache.put('a', texture(1))
+
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('generator failed')
+
+    with pytest.raises(RuntimeError):
+        cache.put_file('a', write)
+    assert np.array_equal(cache.get('a'), texture(1))
+    assert os.listdir(str(tmp_path)) == ['a.npy']
+
+
+@pytest.mark.skipif(os.name == 'nt', reason='Windows cannot replace a mapped file')
+def test_replace_keeps_open_maps_valid(tmp_path):
+    cache = TextureCache(str(tmp_path))
+    old = cache.put('a', texture(1))
+    cache.put('a', texture(2))
+    # os.replace swaps the directory entry; a map of the old file still
+    # reads the old data instead of a half-written new one.
+    assert np.array_equal(old, texture(1))
+    assert np.array_equal(cache.get('a'), texture(2))
@@ -0,0 +1,156 @@
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get(
+    'TEXTURE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.texture_cache'))
+CACHE_MAX_BYTES = int(os.environ.get('TEXTURE_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+_code_versions = {}
+
+
+def code_version(func):
+    module = sys.modules.get(func.__module__)
+    name = func.__module__ if module is not None else func.__qualname__
+    if name not in _code_versions:
+        try:
+            source = inspect.getsource(module if module is not None else func)
+        except (OSError, TypeError):
+            source = func.__code__.co_code.hex()
+        _code_versions[name] = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    return _code_versions[name]
+
+
+class TextureCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, name, func, params):
+        payload = json.dumps({
+            'name': name,
+            'params': params,
+            'code': code_version(func),
+            'version': CACHE_VERSION,
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return array
+
+    def put(self, key, array):
+        def write(path):
+            with open(path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+        return self.put_file(key, write)
+
+    def put_file(self, key, write):
+        # write(path) creates the .npy itself, e.g. through open_memmap, so a
+        # large texture reaches the cache without a copy in memory.
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        try:
+            write(tmp_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+        return np.load(path, mmap_mode='r')
+
+    def get_or_create(self, name, func, **params):
+        key = self.key(name, func, params)
+        array = self.get(key)
+        if array is not None:
+            self.hits += 1
+            return array
+        self.misses += 1
+        write_npy = getattr(func, 'write_npy', None)
+        if write_npy is not None:
+            return self.put_file(key, lambda path: write_npy(path, **params))
+        return self.put(key, func(**params))
+
+    def get_or_create_derived(self, name, base_key, func, source, **params):
+        key = self.key(name, func, dict(params, base=base_key))
+        array = self.get(key)
+        if array is not None:
+            self.hits += 1
+            return array
+        self.misses += 1
+        return self.put(key, func(source, **params))
+
+    def entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for filename in names:
+            if not filename.endswith('.npy'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TextureCache()
+    return _default_cache
@@ -0,0 +1,166 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from OpenGL.GL import *
+
+from mipmaps import level_sizes, pack_chain, unpack_chain
+
+TEXTURE_BUDGET = 256 * 1024 * 1024
+
+
+def pixel_buffer(array):
+    if array.flags.c_contiguous:
+        return array, GL_RGB, 1
+    height, width = array.shape[:2]
+    padded = ((width * 3 + 3) // 4) * 4
+    if array.strides[2] == -1 and array.strides[1] == 3 and array.strides[0] == padded:
+        # A channel-reversed view of 4-byte aligned BGR rows, as bmp.read_bmp
+        # returns: upload the underlying rows directly as GL_BGR.
+        bgr = array[..., ::-1]
+        rows = np.lib.stride_tricks.as_strided(bgr, shape=(height, padded), strides=(padded, 1))
+        return rows, GL_BGR, 4
+    return np.ascontiguousarray(array), GL_RGB, 1
+
+
+def content_key(array):
+    data, pixel_format, _ = pixel_buffer(array)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((array.shape, array.dtype.str, pixel_format)).encode('ascii'))
+    digest.update(data.data)
+    return digest.hexdigest()
+
+
+def upload_level(level, data, sub_image):
+    buffer, pixel_format, alignment = pixel_buffer(data)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, alignment)
+    height, width = data.shape[:2]
+    if sub_image:
+        glTexSubImage2D(GL_TEXTURE_2D, level, 0, 0, width, height, pixel_format, GL_UNSIGNED_BYTE, buffer)
+    else:
+        glTexImage2D(GL_TEXTURE_2D, level, GL_RGB, width, height, 0, pixel_format, GL_UNSIGNED_BYTE, buffer)
+
+
+class TextureSlot:
+    def __init__(self, texture_id, width, height, levels):
+        self.texture_id = texture_id
+        self.width = width
+        self.height = height
+        self.key = None
+        self.levels = levels
+        self.nbytes = sum(w * h * 3 for w, h in level_sizes(width, height)[:levels])
+
+
+class TextureManager:
+    def __init__(self, budget_bytes=TEXTURE_BUDGET, mipmaps=True, mip_method='box', cache=None, state=None):
+        self.budget_bytes = budget_bytes
+        self.state = state
+        self.mipmaps = mipmaps
+        self.mip_method = mip_method
+        self.cache = cache
+        self.slots = OrderedDict()
+        self.uploads = 0
+        self.sub_uploads = 0
+        self.binds = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self):
+        return sum(slot.nbytes for slot in self.slots.values())
+
+    def resident(self, source, key):
+        slot = self.slots.get(source)
+        return slot is not None and slot.key == key
+
+    def bind(self, source):
+        slot = self.slots[source]
+        self.slots.move_to_end(source)
+        self.bind_texture(slot.texture_id)
+        return slot.texture_id
+
+    def bind_texture(self, texture_id):
+        if self.state is not None:
+            self.state.bind_texture(GL_TEXTURE_2D, texture_id)
+        else:
+            glBindTexture(GL_TEXTURE_2D, texture_id)
+
+    def upload(self, source, array, key=None, mip_levels=None, max_level=None):
+        # max_level caps the chain for textures whose lower levels would be
+        # wrong, such as atlases whose tiles bleed together below some size.
+        if key is None:
+            key = content_key(array)
+        height, width = array.shape[:2]
+
+        slot = self.slots.get(source)
+        if slot is not None and slot.key == key:
+            self.binds += 1
+            return self.bind(source)
+
+        if mip_levels is None:
+            mip_levels = self.mip_levels(array, key, max_level)
+        elif max_level is not None:
+            mip_levels = mip_levels[:max_level]
+        levels = [array] + mip_levels
+        if slot is not None and (slot.width, slot.height) == (width, height) and slot.levels == len(levels):
+            self.bind_texture(slot.texture_id)
+            for level, data in enumerate(levels):
+                upload_level(level, data, sub_image=True)
+            self.sub_uploads += 1
+        else:
+            if slot is not None:
+                self.delete(source)
+            slot = TextureSlot(glGenTextures(1), width, height, len(levels))
+            self.bind_texture(slot.texture_id)
+            for level, data in enumerate(levels):
+                upload_level(level, data, sub_image=False)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, len(levels) - 1)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER,
+                            GL_LINEAR_MIPMAP_LINEAR if len(levels) > 1 else GL_LINEAR)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+            self.slots[source] = slot
+            self.uploads += 1
+
+        slot.key = key
+        self.slots.move_to_end(source)
+        self.evict(keep=source)
+        return slot.texture_id
+
+    def mip_levels(self, array, key, max_level=None):
+        if not self.mipmaps or max_level == 0:
+            return []
+        height, width = array.shape[:2]
+        if self.cache is None:
+            packed = pack_chain(array, self.mip_method)
+        else:
+            packed = self.cache.get_or_create_derived(
+                'mips', key, pack_chain, array, method=self.mip_method)
+        return unpack_chain(packed, width, height)[:max_level]
+
+    def evict(self, keep=None):
+        total = self.resident_bytes
+        for source in list(self.slots):
+            if total <= self.budget_bytes:
+                break
+            if source == keep:
+                continue
+            total -= self.slots[source].nbytes
+            self.delete(source)
+            self.evictions += 1
+
+    def delete(self, source):
+        slot = self.slots.pop(source)
+        if self.state is not None:
+            self.state.delete_textures([slot.texture_id])
+        else:
+            glDeleteTextures([slot.texture_id])
+
+    def clear(self):
+        for source in list(self.slots):
+            self.delete(source)
+
+    def forget_all(self):
+        # For a new GL context: the old texture names died with their context
+        # and must not be deleted or bound again on the new one.
+        self.slots.clear()
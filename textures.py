@@ -1,5 +1,15 @@
+import argparse
+import functools
+import os
+import tempfile
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from texture_cache import default_cache
+from streaming import BAND_ROWS, stream_texture, write_array
+
+TILED_MIN_PIXELS = 2048 * 2048
 
 def create_test_texture():
     img = Image.new('RGB', (512, 512), color=(200, 200, 200))
@@ -35,80 +45,170 @@ def create_test_texture():
     
     img.save('media/texture.bmp')
 
-def create_wood_textures():
-    light_wood = Image.new('RGB', (256, 256))
-    pixels = light_wood.load()
+def _band(width, height, out, y0, y1):
+    if height is None:
+        height = width
+    if y1 is None:
+        y1 = height
+    if out is None:
+        out = np.empty((y1 - y0, width, 3), dtype=np.uint8)
+    return height, y1, out
+
+def wood_array(width=256, height=None, base=210, amplitude=15, green_shift=30, blue_shift=70,
+               out=None, y0=0, y1=None):
+    height, y1, out = _band(width, height, out, y0, y1)
+    i = np.arange(width)
+    shade = base - (np.sin(i * 0.05) * amplitude)
+    row = np.stack([shade, shade - green_shift, shade - blue_shift], axis=-1)
+    out[...] = np.clip(row.astype(np.int64), 0, 255).astype(np.uint8)
+    return out
+
+def spiral_mask(width, height, y0=0, y1=None):
+    if y1 is None:
+        y1 = height
+    x = ((np.arange(width) - width // 2) / width * 8)[np.newaxis, :]
+    y = ((np.arange(y0, y1) - height // 2) / height * 8)[:, np.newaxis]
+    
+    r = np.sqrt(x*x + y*y)
     
-    for i in range(256):
-        for j in range(256):
-            base = 210 - (np.sin(i * 0.05) * 15)
-            r = int(base)
-            g = int(base - 30)
-            b = int(base - 70)
-            pixels[i, j] = (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
+    nonzero = x != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fi = np.where(nonzero, np.arctan(y / np.where(nonzero, x, 1.0)), np.pi / 2)
     
-    light_wood.save('media/1.bmp')
+    value = np.abs(np.cos(8 * fi - r))
+    return (value % 1.0) < 0.75
 
-    dark_wood = Image.new('RGB', (256, 256))
-    pixels = dark_wood.load()
+def spiral_array(width=512, height=None, out=None, y0=0, y1=None):
+    height, y1, out = _band(width, height, out, y0, y1)
+    out[...] = (0, 0, 255)
+    out[spiral_mask(width, height, y0, y1)] = (255, 255, 0)
+    return out
+
+def checkerboard_array(width=512, height=None, out=None, y0=0, y1=None,
+                       light=(210, 180, 140), dark=(101, 67, 33)):
+    height, y1, out = _band(width, height, out, y0, y1)
+    hw = width // 2
+    top = max(0, min(height // 2, y1) - y0)
+    out[:top, :hw] = dark
+    out[:top, hw:] = light
+    out[top:, :hw] = light
+    out[top:, hw:] = dark
+    return out
+
+def _fill_tile(func, path, params, y0, y1):
+    out = np.load(path, mmap_mode='r+')
+    func(out=out[y0:y1], y0=y0, y1=y1, **params)
+    out.flush()
+    return y1 - y0
+
+def generate_tiled(func, path, width, height=None, workers=None, tile_rows=64, **params):
+    if height is None:
+        height = width
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(height, width, 3))
+    del out
     
-    for i in range(256):
-        for j in range(256):
-            base = 101 - (np.sin(i * 0.05) * 10)
-            r = int(base)
-            g = int(base - 34)
-            b = int(base - 68)
-            pixels[i, j] = (max(0, min(255, r)), max(0, min(255, g)), max(0, min(255, b)))
+    params = dict(params, width=width, height=height)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fill_tile, func, path, params, y0, min(y0 + tile_rows, height))
+                   for y0 in range(0, height, tile_rows)]
+        for future in futures:
+            future.result()
     
-    dark_wood.save('media/2.bmp')
+    return np.load(path, mmap_mode='r')
+
+def tiled(func, workers=None):
+    # func under its own name, so cache keys stay the same, but textures of
+    # TILED_MIN_PIXELS or more are filled in row tiles by a process pool.
+    # TextureCache calls write_npy, which generates straight into the
+    # cache's .npy file instead of returning an array to be copied there.
+    def write_npy(path, width, height=None, **params):
+        if width * (height or width) >= TILED_MIN_PIXELS:
+            return generate_tiled(func, path, width, height, workers, **params)
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                        shape=(height or width, width, 3))
+        func(width, height, out=out, **params)
+        out.flush()
+        return out
 
-def create_2x2_checkerboard():
+    @functools.wraps(func)
+    def generate(width, height=None, **params):
+        if width * (height or width) < TILED_MIN_PIXELS:
+            return func(width, height, **params)
+        with tempfile.TemporaryDirectory() as directory:
+            tiles = write_npy(os.path.join(directory, 'tiles.npy'), width, height, **params)
+            array = np.array(tiles)
+            del tiles
+        return array
+    generate.write_npy = write_npy
+    return generate
+
+def create_wood_textures(size=256, cache=None):
+    if cache is None:
+        cache = default_cache()
+    light_wood = cache.get_or_create(
+        'wood', wood_array, width=size, base=210, amplitude=15, green_shift=30, blue_shift=70)
+    write_array('media/1.bmp', light_wood)
+
+    dark_wood = cache.get_or_create(
+        'wood', wood_array, width=size, base=101, amplitude=10, green_shift=34, blue_shift=68)
+    write_array('media/2.bmp', dark_wood)
+
+def create_2x2_checkerboard(size=512):
+    half = size // 2
     try:
         light = Image.open('media/1.bmp')
         dark = Image.open('media/2.bmp')
     except:
-        light = Image.new('RGB', (256, 256), color=(210, 180, 140))
-        dark = Image.new('RGB', (256, 256), color=(101, 67, 33))
+        light = Image.new('RGB', (half, half), color=(210, 180, 140))
+        dark = Image.new('RGB', (half, half), color=(101, 67, 33))
+    
+    if light.size != (half, half):
+        light = light.resize((half, half))
+    if dark.size != (half, half):
+        dark = dark.resize((half, half))
     
-    checkerboard = Image.new('RGB', (512, 512))
+    checkerboard = Image.new('RGB', (size, size))
     
     checkerboard.paste(dark, (0, 0))
-    checkerboard.paste(light, (256, 0))
-    checkerboard.paste(light, (0, 256))
-    checkerboard.paste(dark, (256, 256))
+    checkerboard.paste(light, (half, 0))
+    checkerboard.paste(light, (0, half))
+    checkerboard.paste(dark, (half, half))
     
     checkerboard.save('media/2x2.bmp')
 
-def create_spiral_pattern():
-    img = Image.new('RGB', (512, 512))
-    pixels = img.load()
-    
-    for i in range(512):
-        for j in range(512):
-            x = (i - 256) / 512 * 8
-            y = (j - 256) / 512 * 8
-            
-            r = np.sqrt(x*x + y*y)
-            
-            if x != 0:
-                fi = np.arctan(y / x)
-            else:
-                fi = np.pi / 2
-            
-            value = abs(np.cos(8 * fi - r))
-            
-            if (value % 1.0) < 0.75:
-                pixels[i, j] = (255, 255, 0)
-            else:
-                pixels[i, j] = (0, 0, 255)
-    
-    img.save('media/pattern.bmp')
-
-def main():
+def create_spiral_pattern(size=512, cache=None):
+    if cache is None:
+        cache = default_cache()
+    # The spiral is compute-bound and gains from tiling; wood_array only
+    # repeats one row, so it is limited by memory bandwidth either way.
+    # The cached memmap is written band by band, never loaded whole.
+    write_array('media/pattern.bmp', cache.get_or_create('spiral', tiled(spiral_array), width=size))
+
+STREAM_GENERATORS = {
+    'wood': wood_array,
+    'spiral': spiral_array,
+    'checkerboard': checkerboard_array,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the lab textures.')
+    parser.add_argument('--stream', choices=sorted(STREAM_GENERATORS),
+                        help='write one generated texture band by band instead of the media set')
+    parser.add_argument('--size', type=int, default=512,
+                        help='texture side; textures of %d pixels or more are generated on all cores' % TILED_MIN_PIXELS)
+    parser.add_argument('--out', help='output path; .bmp, .png or .raw')
+    parser.add_argument('--band-rows', type=int, default=BAND_ROWS)
+    args = parser.parse_args(argv)
+    
+    if args.stream:
+        out = args.out or '%s_%d.bmp' % (args.stream, args.size)
+        stream_texture(STREAM_GENERATORS[args.stream], out, args.size, band_rows=args.band_rows)
+        return
+    
     create_test_texture()
-    create_wood_textures()
-    create_2x2_checkerboard()
-    create_spiral_pattern()
+    create_wood_textures(args.size // 2)
+    create_2x2_checkerboard(args.size)
+    create_spiral_pattern(args.size)
 
 
 if __name__ == "__main__":